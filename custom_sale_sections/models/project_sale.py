@@ -1,6 +1,52 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+import logging
+
 from odoo import models, fields, _, api
 from odoo.exceptions import UserError
+from odoo.tools import float_is_zero
+
+_logger = logging.getLogger(__name__)
+
+# Código de producto -> (campo del proyecto, campo de la línea de venta que se suma).
+# Añadir un servicio nuevo solo requiere una entrada aquí y su campo en el proyecto.
+SERVICE_CODE_FIELDS = {
+    'PCT-MUESTRA': ('x_total_muestra', 'price_subtotal'),
+    'PCT-BARNIZ': ('x_total_barniz', 'price_subtotal'),
+    'PCT-OFITEC': ('x_total_ofitec', 'price_subtotal'),
+    'PCT-REPASOS': ('x_total_repasos', 'price_subtotal'),
+    'SERV-CAJONES': ('x_qty_cajones', 'product_uom_qty'),
+    'SERV-PLATAFORMA': ('x_qty_plataforma', 'product_uom_qty'),
+    'SERV-DESPLAZAMIENTO': ('x_qty_desplazamiento', 'product_uom_qty'),
+    'SERV-REPARTO': ('x_qty_reparto', 'product_uom_qty'),
+    'SERV-FABRICACION': ('x_qty_fabricacion', 'product_uom_qty'),
+    'SERV-MONTAJE': ('x_qty_montaje', 'product_uom_qty'),
+}
+
+# Totales del pedido que se acumulan en el proyecto.
+ORDER_TOTAL_FIELDS = {
+    'amount_untaxed': 'total_amount_untaxed',
+    'amount_tax': 'total_amount_tax',
+    'amount_total': 'total_amount_total',
+}
+
+# Clave de contexto con los ids de los pedidos cuyas diferencias ya está
+# aplicando una operación exterior (evita contarlas dos veces en escrituras
+# anidadas sin ocultar las de otros pedidos).
+PROJECT_TOTALS_GUARD = 'project_sale_totals_tracking'
+
+# Clave de contexto durante la creación de pedidos: último id de pedido que
+# existía al empezar. Los pedidos con un id mayor se están creando y su
+# aportación se aplica una sola vez al terminar SaleOrder.create.
+PROJECT_TOTALS_CREATING = 'project_sale_totals_created_after'
+
+# Campos de línea que pueden cambiar algún total del proyecto; la escritura de
+# cualquier otro campo no aplica diferencias.
+PROJECT_TOTALS_LINE_FIELDS = {
+    'price_subtotal', 'price_total', 'product_uom_qty', 'price_unit', 'discount',
+    'tax_id', 'display_type', 'order_id', 'product_id', 'product_uom',
+    'product_packaging_id', 'product_packaging_qty',
+} | {line_field for _field_name, line_field in SERVICE_CODE_FIELDS.values()}
 
 class ProjectProject(models.Model):
     _inherit = 'project.project'
@@ -20,37 +66,37 @@ class ProjectProject(models.Model):
     )
     
     # --- CAMPOS DE TOTALES GENERALES (MONETARIOS) ---
+    # Estos totales y los de servicios no se recalculan desde todas las líneas:
+    # cada alta, cambio o baja de pedidos y líneas aplica su diferencia
+    # (ver SaleOrder/SaleOrderLine más abajo y action_recompute_sale_totals).
     total_amount_untaxed = fields.Monetary(
         string='Base Imponible Total',
-        compute='_compute_sale_order_totals',
         store=True,
         readonly=True
     )
     total_amount_tax = fields.Monetary(
         string='Impuestos Totales',
-        compute='_compute_sale_order_totals',
         store=True,
         readonly=True
     )
     total_amount_total = fields.Monetary(
         string='Total General',
-        compute='_compute_sale_order_totals',
         store=True,
         readonly=True
     )
     
     # --- CAMPOS DE DESGLOSE DE PORCENTAJES (MONETARIOS) ---
-    x_total_muestra = fields.Monetary(string="MUESTRA (5%)", compute='_compute_pct_totals', store=True, readonly=True)
-    x_total_barniz = fields.Monetary(string="REPASO DE BARNIZ (1%)", compute='_compute_pct_totals', store=True, readonly=True)
-    x_total_ofitec = fields.Monetary(string="OFICINA TÉCNICA (4%)", compute='_compute_pct_totals', store=True, readonly=True)
-    x_total_repasos = fields.Monetary(string="REPASOS (1%)", compute='_compute_pct_totals', store=True, readonly=True)
+    x_total_muestra = fields.Monetary(string="MUESTRA (5%)", store=True, readonly=True)
+    x_total_barniz = fields.Monetary(string="REPASO DE BARNIZ (1%)", store=True, readonly=True)
+    x_total_ofitec = fields.Monetary(string="OFICINA TÉCNICA (4%)", store=True, readonly=True)
+    x_total_repasos = fields.Monetary(string="REPASOS (1%)", store=True, readonly=True)
     
-    x_qty_cajones = fields.Float(string="TOTAL DE CAJONES", compute='_compute_service_quantities', store=True, readonly=True)
-    x_qty_plataforma = fields.Float(string="IMPORTE TOTAL SUBIDA DE MATERIAL CON PLATAFORMA", compute='_compute_service_quantities', store=True, readonly=True)
-    x_qty_desplazamiento = fields.Float(string="HORAS DE DESPLAZAMIENTOS", compute='_compute_service_quantities', store=True, readonly=True)
-    x_qty_reparto = fields.Float(string="TOTAL HORAS REPARTO DE MATERIAL EN OBRA", compute='_compute_service_quantities', store=True, readonly=True)
-    x_qty_fabricacion = fields.Float(string="TOTAL HORAS DE FABRICACIÓN", compute='_compute_service_quantities', store=True, readonly=True)
-    x_qty_montaje = fields.Float(string="TOTAL HORAS DE MONTAJE", compute='_compute_service_quantities', store=True, readonly=True)
+    x_qty_cajones = fields.Float(string="TOTAL DE CAJONES", store=True, readonly=True)
+    x_qty_plataforma = fields.Float(string="IMPORTE TOTAL SUBIDA DE MATERIAL CON PLATAFORMA", store=True, readonly=True)
+    x_qty_desplazamiento = fields.Float(string="HORAS DE DESPLAZAMIENTOS", store=True, readonly=True)
+    x_qty_reparto = fields.Float(string="TOTAL HORAS REPARTO DE MATERIAL EN OBRA", store=True, readonly=True)
+    x_qty_fabricacion = fields.Float(string="TOTAL HORAS DE FABRICACIÓN", store=True, readonly=True)
+    x_qty_montaje = fields.Float(string="TOTAL HORAS DE MONTAJE", store=True, readonly=True)
     
     def action_create_sale_order_with_lines(self):
         self.ensure_one()
@@ -126,29 +172,13 @@ class ProjectProject(models.Model):
         for project in self:
             project.currency_id = project.company_id.currency_id or self.env.company.currency_id
 
-    @api.depends('sale_order_ids.amount_untaxed', 'sale_order_ids.amount_tax', 'sale_order_ids.amount_total')
-    def _compute_sale_order_totals(self):
-        for project in self:
-            project._calculate_and_set_totals()
-
-    @api.depends('sale_order_ids.order_line.price_subtotal', 'sale_order_ids.order_line.product_id.default_code')
-    def _compute_pct_totals(self):
-        for project in self:
-            project._calculate_and_set_pct_totals()
-
-    @api.depends('sale_order_ids.order_line.product_uom_qty', 'sale_order_ids.order_line.product_id.default_code')
-    def _compute_service_quantities(self):
-        for project in self:
-            project._calculate_and_set_service_quantities()
-
     @api.onchange('sale_order_ids')
     def _onchange_sale_order_ids(self):
         """
         Se dispara INMEDIATAMENTE en la interfaz para actualizar todos los campos calculados.
         """
         self._calculate_and_set_totals()
-        self._calculate_and_set_pct_totals()
-        self._calculate_and_set_service_quantities()
+        self._calculate_and_set_service_totals()
 
     def _calculate_and_set_totals(self):
         """Calcula los totales generales del proyecto."""
@@ -156,23 +186,77 @@ class ProjectProject(models.Model):
         self.total_amount_tax = sum(self.sale_order_ids.mapped('amount_tax'))
         self.total_amount_total = sum(self.sale_order_ids.mapped('amount_total'))
 
-    def _calculate_and_set_pct_totals(self):
-        """Calcula los subtotales de los servicios de porcentaje."""
-        all_lines = self.sale_order_ids.mapped('order_line')
-        self.x_total_muestra = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'PCT-MUESTRA').mapped('price_subtotal'))
-        self.x_total_barniz = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'PCT-BARNIZ').mapped('price_subtotal'))
-        self.x_total_ofitec = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'PCT-OFITEC').mapped('price_subtotal'))
-        self.x_total_repasos = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'PCT-REPASOS').mapped('price_subtotal'))
-
-    def _calculate_and_set_service_quantities(self):
-        """Calcula las cantidades totales de los servicios."""
-        all_lines = self.sale_order_ids.mapped('order_line')
-        self.x_qty_cajones = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-CAJONES').mapped('product_uom_qty'))
-        self.x_qty_plataforma = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-PLATAFORMA').mapped('product_uom_qty'))
-        self.x_qty_desplazamiento = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-DESPLAZAMIENTO').mapped('product_uom_qty'))
-        self.x_qty_reparto = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-REPARTO').mapped('product_uom_qty'))
-        self.x_qty_fabricacion = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-FABRICACION').mapped('product_uom_qty'))
-        self.x_qty_montaje = sum(all_lines.filtered(lambda l: l.product_id.default_code == 'SERV-MONTAJE').mapped('product_uom_qty'))
+    def _calculate_and_set_service_totals(self):
+        """
+        Calcula los subtotales de los servicios de porcentaje y las cantidades de
+        los servicios en una sola pasada por las líneas, según SERVICE_CODE_FIELDS.
+        """
+        totals = dict.fromkeys((field_name for field_name, _line_field in SERVICE_CODE_FIELDS.values()), 0.0)
+        for line in self.sale_order_ids.order_line:
+            mapping = SERVICE_CODE_FIELDS.get(line.product_id.default_code)
+            if mapping:
+                field_name, line_field = mapping
+                totals[field_name] += line[line_field]
+        for field_name, total in totals.items():
+            self[field_name] = total
+
+    def _get_sale_totals_from_orders(self):
+        """ Totales calculados desde cero a partir de todos los pedidos de los proyectos. """
+        totals = {project.id: dict.fromkeys(self._get_sale_total_fields(), 0.0) for project in self}
+        contributions = self.env['sale.order'].search([('project_id', 'in', self.ids)])._get_project_sale_contributions()
+        for project_id, values in contributions.items():
+            for field_name, amount in values.items():
+                totals[project_id][field_name] += amount
+        return totals
+
+    @api.model
+    def _get_sale_total_fields(self):
+        return list(ORDER_TOTAL_FIELDS.values()) + [field_name for field_name, _line_field in SERVICE_CODE_FIELDS.values()]
+
+    def _apply_sale_total_deltas(self, deltas):
+        """ Suma a cada proyecto las diferencias {id proyecto: {campo: importe}}. """
+        for project in self.browse(list(deltas)).exists():
+            vals = {
+                field_name: project[field_name] + delta
+                for field_name, delta in deltas[project.id].items()
+                if delta
+            }
+            if vals:
+                project.sudo().write(vals)
+
+    def action_recompute_sale_totals(self):
+        """
+        Recalcula desde cero los totales de venta de los proyectos, los compara con
+        los mantenidos por diferencias y corrige (y registra) los que no coinciden.
+        """
+        mismatches = []
+        for project_id, totals in self._get_sale_totals_from_orders().items():
+            project = self.browse(project_id)
+            vals = {
+                field_name: total
+                for field_name, total in totals.items()
+                if not float_is_zero(project[field_name] - total, precision_digits=2)
+            }
+            if vals:
+                mismatches.append(project)
+                _logger.warning(
+                    "Totales de venta desfasados en el proyecto %s: %s",
+                    project.display_name,
+                    {field_name: (project[field_name], total) for field_name, total in vals.items()},
+                )
+                project.sudo().write(vals)
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Totales de Venta'),
+                'message': _('%(checked)s proyectos revisados, %(fixed)s corregidos.',
+                             checked=len(self), fixed=len(mismatches)),
+                'type': 'warning' if mismatches else 'success',
+                'sticky': False,
+            },
+        }
 
     def action_send_so_list_by_email(self):
         self.ensure_one()
@@ -210,4 +294,134 @@ class ProjectProject(models.Model):
             'view_id': compose_form_id,
             'target': 'new',
             'context': ctx,
-        }
\ No newline at end of file
+        }
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def _get_project_sale_contributions(self, include_lines=True, lines=None):
+        """
+        Aportación de estos pedidos a los totales de sus proyectos:
+        {id proyecto: {campo del proyecto: importe}}.
+        Con include_lines=False solo se calculan los totales del pedido; con
+        ``lines`` solo se suman los servicios de esas líneas.
+        """
+        contributions = defaultdict(lambda: defaultdict(float))
+        orders = self.exists()
+        for order in orders:
+            if not order.project_id:
+                continue
+            values = contributions[order.project_id.id]
+            for order_field, project_field in ORDER_TOTAL_FIELDS.items():
+                values[project_field] += order[order_field]
+        if not include_lines:
+            return contributions
+        for line in (orders.order_line if lines is None else lines.exists()):
+            mapping = SERVICE_CODE_FIELDS.get(line.product_id.default_code)
+            if mapping and line.order_id.project_id:
+                project_field, line_field = mapping
+                contributions[line.order_id.project_id.id][project_field] += line[line_field]
+        return contributions
+
+    def _get_untracked_orders(self):
+        """ Pedidos cuyas diferencias no está aplicando ya una operación exterior. """
+        tracked = set(self.env.context.get(PROJECT_TOTALS_GUARD) or ())
+        created_after = self.env.context.get(PROJECT_TOTALS_CREATING)
+        return self.filtered(lambda order: order.id not in tracked and not (
+            created_after is not None and order.id > created_after))
+
+    def _with_totals_guard(self, records, orders):
+        """ ``records`` con los pedidos indicados marcados como ya controlados. """
+        tracked = set(self.env.context.get(PROJECT_TOTALS_GUARD) or ()) | set(orders.ids)
+        return records.with_context(**{PROJECT_TOTALS_GUARD: tuple(tracked)})
+
+    @api.model
+    def _apply_project_sale_contributions(self, before, after):
+        """ Aplica a los proyectos la diferencia entre dos aportaciones. """
+        deltas = defaultdict(lambda: defaultdict(float))
+        for project_id, values in after.items():
+            for field_name, amount in values.items():
+                deltas[project_id][field_name] += amount
+        for project_id, values in before.items():
+            for field_name, amount in values.items():
+                deltas[project_id][field_name] -= amount
+        self.env['project.project']._apply_sale_total_deltas(deltas)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        created_after = self.env.context.get(PROJECT_TOTALS_CREATING)
+        if created_after is not None:
+            # Creación anidada: la aplica el SaleOrder.create exterior
+            return super().create(vals_list)
+        # Las líneas de los pedidos nuevos (comandos de order_line) se crean
+        # dentro de super(): sus hooks ignoran estos pedidos y la aportación
+        # completa se aplica una sola vez al terminar.
+        self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM sale_order")
+        created_after = self.env.cr.fetchone()[0]
+        orders = super(SaleOrder, self.with_context(**{PROJECT_TOTALS_CREATING: created_after})).create(vals_list)
+        orders = orders.with_env(self.env)
+        self._apply_project_sale_contributions({}, orders._get_project_sale_contributions())
+        return orders
+
+    def write(self, vals):
+        orders = self._get_untracked_orders()
+        if not orders:
+            return super().write(vals)
+        # Las líneas solo cambian si se escriben o si el pedido cambia de proyecto
+        include_lines = 'order_line' in vals or 'project_id' in vals
+        before = orders._get_project_sale_contributions(include_lines)
+        res = super(SaleOrder, self._with_totals_guard(self, orders)).write(vals)
+        self._apply_project_sale_contributions(before, orders._get_project_sale_contributions(include_lines))
+        return res
+
+    def unlink(self):
+        orders = self._get_untracked_orders()
+        before = orders._get_project_sale_contributions()
+        res = super(SaleOrder, self._with_totals_guard(self, orders)).unlink()
+        self._apply_project_sale_contributions(before, {})
+        return res
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        SaleOrder = self.env['sale.order']
+        orders = SaleOrder.browse({vals['order_id'] for vals in vals_list if vals.get('order_id')})
+        orders = orders._get_untracked_orders()
+        if not orders:
+            return super().create(vals_list)
+        # Solo cambian los totales del pedido y los servicios de las líneas nuevas
+        before = orders._get_project_sale_contributions(include_lines=False)
+        lines = super(SaleOrderLine, SaleOrder._with_totals_guard(self, orders)).create(vals_list)
+        lines = lines.with_env(self.env)
+        SaleOrder._apply_project_sale_contributions(before, orders._get_project_sale_contributions(
+            lines=lines.filtered(lambda line: line.order_id in orders)))
+        return lines
+
+    def write(self, vals):
+        if not PROJECT_TOTALS_LINE_FIELDS & set(vals):
+            return super().write(vals)
+        SaleOrder = self.env['sale.order']
+        orders = self.order_id
+        if vals.get('order_id'):
+            orders |= SaleOrder.browse(vals['order_id'])
+        orders = orders._get_untracked_orders()
+        if not orders:
+            return super().write(vals)
+        # Al mover líneas a un pedido controlado aquí, cuentan todas las líneas
+        lines = self if vals.get('order_id') in orders.ids else self.filtered(lambda line: line.order_id in orders)
+        before = orders._get_project_sale_contributions(lines=lines)
+        res = super(SaleOrderLine, SaleOrder._with_totals_guard(self, orders)).write(vals)
+        SaleOrder._apply_project_sale_contributions(before, orders._get_project_sale_contributions(lines=lines))
+        return res
+
+    def unlink(self):
+        SaleOrder = self.env['sale.order']
+        orders = self.order_id._get_untracked_orders()
+        lines = self.filtered(lambda line: line.order_id in orders)
+        before = orders._get_project_sale_contributions(lines=lines)
+        res = super(SaleOrderLine, SaleOrder._with_totals_guard(self, orders)).unlink()
+        SaleOrder._apply_project_sale_contributions(before, orders._get_project_sale_contributions(include_lines=False))
+        return res
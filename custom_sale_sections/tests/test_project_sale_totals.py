@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestProjectSaleTotals(TransactionCase):
+    """
+    Los totales de venta del proyecto se mantienen por diferencias y deben
+    coincidir siempre con el recálculo completo desde los pedidos.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Cliente Totales'})
+        cls.project = cls.env['project.project'].create({'name': 'Proyecto Totales', 'partner_id': cls.partner.id})
+        cls.product = cls.env['product.product'].create({'name': 'Producto Totales'})
+        cls.service = cls.env['product.product'].create({
+            'name': 'Barniz', 'default_code': 'PCT-BARNIZ', 'type': 'service',
+        })
+
+    def _assertTotalsMatchOrders(self):
+        totals = self.project._get_sale_totals_from_orders()[self.project.id]
+        for field_name in self.project._get_sale_total_fields():
+            self.assertAlmostEqual(self.project[field_name], totals.get(field_name, 0.0), msg=field_name)
+
+    def test_create_order_with_lines_counts_once(self):
+        order = self.env['sale.order'].create({
+            'partner_id': self.partner.id,
+            'project_id': self.project.id,
+            'order_line': [
+                Command.create({'product_id': self.product.id, 'product_uom_qty': 2, 'price_unit': 10.0}),
+                Command.create({'product_id': self.service.id, 'product_uom_qty': 1, 'price_unit': 5.0}),
+            ],
+        })
+        self.assertAlmostEqual(self.project.total_amount_untaxed, order.amount_untaxed)
+        self.assertAlmostEqual(self.project.x_total_barniz, 5.0)
+        self._assertTotalsMatchOrders()
+
+        action = self.project.action_recompute_sale_totals()
+        self.assertEqual(action['params']['type'], 'success')
+        self._assertTotalsMatchOrders()
+
+    def test_line_changes_after_create(self):
+        order = self.env['sale.order'].create({
+            'partner_id': self.partner.id,
+            'project_id': self.project.id,
+            'order_line': [Command.create({'product_id': self.product.id, 'product_uom_qty': 1, 'price_unit': 10.0})],
+        })
+        order.order_line.product_uom_qty = 3
+        order.write({'order_line': [Command.create({'product_id': self.service.id, 'price_unit': 7.0})]})
+        self.assertAlmostEqual(self.project.total_amount_untaxed, order.amount_untaxed)
+        self._assertTotalsMatchOrders()
@@ -1,5 +1,6 @@
 from odoo import http, fields
 from odoo.http import request
+from urllib.parse import urlencode
 from odoo.addons.portal.controllers.portal import CustomerPortal
 from datetime import datetime, timedelta,time
 import logging
@@ -23,29 +24,15 @@ class EmployeePortal(CustomerPortal):
         values = super()._prepare_home_portal_values(counters)
 
         employee = request.env.user.employee_id
-        Attendance = request.env['hr.attendance'].sudo()
 
         has_open_attendance = False
         has_today_attendance = False
 
         if employee:
-
-            has_open_attendance = Attendance.search_count([
-                ('employee_id', '=', employee.id),
-                ('check_out', '=', False),
-            ]) > 0
-
-
-            today = fields.Date.today()
-            has_today_attendance = Attendance.search_count([
-                ('employee_id', '=', employee.id),
-                ('check_in', '>=', today),
-                ('check_in', '<', today + timedelta(days=1)),
-            ]) > 0
-
-            values['attendance_count'] = Attendance.search_count([
-                ('employee_id', '=', employee.id)
-            ])
+            summary = request.env['hr.attendance'].sudo()._get_portal_attendance_summary(employee.id)
+            has_open_attendance = summary['has_open_attendance']
+            has_today_attendance = summary['has_today_attendance']
+            values['attendance_count'] = summary['attendance_count']
 
         values.update({
             'employee': employee,
@@ -64,64 +51,40 @@ class EmployeePortal(CustomerPortal):
 
         Attendance = request.env['hr.attendance']
 
-        page = int(kw.get('page', 1))
-        recent_page = int(kw.get('recent_page', 1))
         per_page = 7
-
-
-        total_attendances = Attendance.search_count([
-            ('employee_id', '=', employee.id)
-        ])
-
-        attendances = Attendance.search(
-            [('employee_id', '=', employee.id)],
-            order='check_in desc',
-            limit=per_page,
-            offset=(page - 1) * per_page
-        )
+        cursors = {key: kw.get(key) for key in ('after', 'before', 'recent_after', 'recent_before')}
 
 
         fifteen_days_ago = datetime.now() - timedelta(days=15)
 
-        total_recent = Attendance.search_count([
-            ('employee_id', '=', employee.id),
-            ('check_in', '>=', fifteen_days_ago)
-        ])
+        # Contadores e indicadores en una consulta; ambos listados por cursor en otra
+        summary = Attendance._get_portal_attendance_summary(employee.id, fifteen_days_ago)
+        has_open_attendance = summary['has_open_attendance']
+        has_today_attendance = summary['has_today_attendance']
 
-        recent_attendances = Attendance.search(
-            [
-                ('employee_id', '=', employee.id),
-                ('check_in', '>=', fifteen_days_ago)
-            ],
-            order='check_in desc',
-            limit=per_page,
-            offset=(recent_page - 1) * per_page
+        history, recent = Attendance._get_portal_attendance_pages(
+            employee.id, fifteen_days_ago, per_page, cursors,
         )
 
-
-        has_open_attendance = Attendance.search_count([
-            ('employee_id', '=', employee.id),
-            ('check_out', '=', False),
-        ]) > 0
-
-        # 🟢 Registro hoy
-        today = fields.Date.today()
-        has_today_attendance = Attendance.search_count([
-            ('employee_id', '=', employee.id),
-            ('check_in', '>=', today),
-            ('check_in', '<', today + timedelta(days=1)),
-        ]) > 0
+        def page_url(**changes):
+            # Cada listado conserva el cursor del otro
+            params = {key: value for key, value in dict(cursors, **changes).items() if value}
+            return '/my/attendances' + ('?' + urlencode(params) if params else '')
 
         return request.render("ibec_portal_empleado.portal_attendances_template", {
             'employee': employee,
-            'attendances': attendances,
-            'recent_attendances': recent_attendances,
+            'attendances': history['records'],
+            'recent_attendances': recent['records'],
 
             'page_name': 'attendances',
-            'current_page': page,
-            'recent_current_page': recent_page,
-            'total_pages': (total_attendances + per_page - 1) // per_page,
-            'total_recent_pages': (total_recent + per_page - 1) // per_page,
+            'total_attendances': summary['attendance_count'],
+            'total_recent': summary['recent_count'],
+            'history_prev_url': history['prev_cursor'] and page_url(after=None, before=history['prev_cursor']),
+            'history_next_url': history['next_cursor'] and page_url(after=history['next_cursor'], before=None),
+            'recent_prev_url': recent['prev_cursor'] and page_url(
+                recent_after=None, recent_before=recent['prev_cursor']),
+            'recent_next_url': recent['next_cursor'] and page_url(
+                recent_after=recent['next_cursor'], recent_before=None),
 
             'has_open_attendance': has_open_attendance,
             'has_today_attendance': has_today_attendance,
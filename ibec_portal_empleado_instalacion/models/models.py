@@ -1,6 +1,10 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
-from datetime import datetime
+from odoo.tools import sql
+from datetime import datetime, timedelta
+
+# Formato de la marca de entrada en los cursores del portal
+PORTAL_CURSOR_FORMAT = '%Y%m%d%H%M%S'
 
 
 class HrAttendance(models.Model):
@@ -16,6 +20,14 @@ class HrAttendance(models.Model):
         help="Calcula las horas trabajadas directamente de la entrada y salida."
     )
 
+    def init(self):
+        super().init()
+        # Índice para la paginación por cursor del portal
+        sql.create_index(
+            self.env.cr, 'hr_attendance_employee_check_in_id_index', self._table,
+            ['employee_id', 'check_in DESC', 'id DESC'],
+        )
+
     @api.depends('check_in', 'check_out')
     def _compute_worked_time_calculated(self):
         for attendance in self:
@@ -52,4 +64,149 @@ class HrAttendance(models.Model):
                     if self.search_count(domain):
                         raise ValidationError(
                             _("Este registro se solapa con otro fichaje existente.")
-                        )
\ No newline at end of file
+                        )
+
+    # Portal
+
+    def _get_portal_employee_where(self, employee_id):
+        """Condición base de los fichajes del empleado en el portal.
+
+        Respeta el campo ``active`` si existe, igual que ``search_count``.
+        """
+        where = "employee_id = %s"
+        if 'active' in self._fields:
+            where += " AND active"
+        return where, [employee_id]
+
+    @api.model
+    def _get_portal_attendance_summary(self, employee_id, recent_since=None):
+        """Contadores e indicadores del portal en una sola consulta.
+
+        Devuelve el total de fichajes, los de los últimos días
+        (desde ``recent_since``), si hay una jornada abierta y si hay
+        algún fichaje hoy.
+        """
+        self.flush_model(['employee_id', 'check_in', 'check_out'])
+        today = datetime.combine(fields.Date.today(), datetime.min.time())
+        where, params = self._get_portal_employee_where(employee_id)
+        self.env.cr.execute(f"""
+            SELECT COUNT(*),
+                   COUNT(*) FILTER (WHERE check_in >= %s),
+                   COALESCE(BOOL_OR(check_out IS NULL), FALSE),
+                   COALESCE(BOOL_OR(check_in >= %s AND check_in < %s), FALSE)
+              FROM hr_attendance
+             WHERE {where}
+        """, [recent_since or today, today, today + timedelta(days=1)] + params)
+        total, recent, has_open, has_today = self.env.cr.fetchone()
+        return {
+            'attendance_count': total,
+            'recent_count': recent,
+            'has_open_attendance': has_open,
+            'has_today_attendance': has_today,
+        }
+
+    @api.model
+    def _get_portal_cursor(self, attendance):
+        """Cursor estable de un fichaje: entrada y id."""
+        return '%s-%s' % (attendance.check_in.strftime(PORTAL_CURSOR_FORMAT), attendance.id)
+
+    @api.model
+    def _parse_portal_cursor(self, cursor):
+        """Convierte un cursor del portal en ``(check_in, id)``, o None si no es válido."""
+        try:
+            check_in, attendance_id = (cursor or '').split('-')
+            return datetime.strptime(check_in, PORTAL_CURSOR_FORMAT), int(attendance_id)
+        except ValueError:
+            return None
+
+    def _get_portal_keyset_branch(self, bucket, employee_id, per_page, after=None, before=None, since=None):
+        """Subconsulta de una página por cursor sobre ``(check_in, id)``.
+
+        Con ``before`` se recorre hacia atrás (orden ascendente); en otro caso
+        se leen los fichajes anteriores a ``after``. Se pide un registro de
+        más para saber si queda otra página.
+        """
+        where, params = self._get_portal_employee_where(employee_id)
+        params = [bucket] + params
+        if since:
+            where += " AND check_in >= %s"
+            params.append(since)
+        if before:
+            where += " AND (check_in, id) > (%s, %s)"
+            params += list(before)
+            order = "check_in ASC, id ASC"
+        else:
+            if after:
+                where += " AND (check_in, id) < (%s, %s)"
+                params += list(after)
+            order = "check_in DESC, id DESC"
+        params.append(per_page + 1)
+        query = f"""
+            (SELECT %s AS bucket, id
+               FROM hr_attendance
+              WHERE {where}
+              ORDER BY {order}
+              LIMIT %s)
+        """
+        return query, params
+
+    @api.model
+    def _get_portal_attendance_pages(self, employee_id, recent_since, per_page, cursors):
+        """Página del histórico y de los fichajes recientes en una sola consulta.
+
+        La paginación es por cursor (``after``/``before`` para el histórico y
+        ``recent_after``/``recent_before`` para los recientes), de modo que el
+        coste no depende de la profundidad de la página y los enlaces no se
+        desplazan al insertar fichajes. Devuelve por listado los registros y
+        los cursores de la página anterior y siguiente.
+        """
+        self.check_access('read')
+        self.flush_model(['employee_id', 'check_in'])
+        parsed = {key: self._parse_portal_cursor(cursors.get(key)) for key in (
+            'after', 'before', 'recent_after', 'recent_before')}
+        buckets = {
+            'all': {'after': parsed['after'], 'before': parsed['before'], 'since': None},
+            'recent': {'after': parsed['recent_after'], 'before': parsed['recent_before'], 'since': recent_since},
+        }
+
+        def fetch(bucket_names):
+            queries, params = [], []
+            for bucket in bucket_names:
+                query, query_params = self._get_portal_keyset_branch(
+                    bucket, employee_id, per_page, **buckets[bucket])
+                queries.append(query)
+                params += query_params
+            self.env.cr.execute(" UNION ALL ".join(queries), params)
+            ids = {bucket: [] for bucket in bucket_names}
+            for bucket, attendance_id in self.env.cr.fetchall():
+                ids[bucket].append(attendance_id)
+            return ids
+
+        ids = fetch(list(buckets))
+        # Hacia atrás sin página anterior: se vuelve a la primera página
+        first_pages = [
+            bucket for bucket, spec in buckets.items()
+            if spec['before'] and len(ids[bucket]) <= per_page
+        ]
+        for bucket in first_pages:
+            buckets[bucket].update(after=None, before=None)
+        if first_pages:
+            ids.update(fetch(first_pages))
+
+        result = {}
+        for bucket, spec in buckets.items():
+            bucket_ids = ids[bucket]
+            has_more = len(bucket_ids) > per_page
+            bucket_ids = bucket_ids[:per_page]
+            if spec['before']:
+                bucket_ids.reverse()
+                has_prev, has_next = has_more, True
+            else:
+                has_prev, has_next = bool(spec['after']), has_more
+            records = self.browse(bucket_ids)
+            result[bucket] = {
+                'records': records,
+                'prev_cursor': has_prev and records and self._get_portal_cursor(records[0]) or None,
+                'next_cursor': has_next and records and self._get_portal_cursor(records[-1]) or None,
+            }
+        return result['all'], result['recent']
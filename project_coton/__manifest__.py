@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Project Coton',
-    'version': '1.0',
+    'version': '1.1',
     'summary': 'Brief description of the module',
     'description': '''
         Detailed description of the module
@@ -11,10 +11,12 @@
     'company': 'Cybrosys Techno Solutions',
     'maintainer': 'Cybrosys Techno Solutions',
     'website': 'https://www.cybrosys.com',
-    'depends': ['base', 'project', 'sale_management', 'purchase', 'account', 'analytic'],
+    'depends': ['base', 'project', 'sale_management', 'purchase', 'account', 'analytic',
+                'custom_sale_sections', 'sale_cotonb'],
     'data': [
         'security/ir.model.access.csv',
         'views/project_coton_views.xml',
+        'data/unified_line_data.xml',
     ],
     'license': 'LGPL-3',
     'installable': True,
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Enlaza con su línea de venta ('x_source_sale_line_id') las líneas de compra
+    creadas por la sincronización antigua, que solo guardaba el 'origin'.
+    La vista de líneas unificadas une las compras por esa clave; sin este
+    relleno sus costes desaparecerían de los proyectos.
+
+    Cada línea de compra se enlaza con la primera línea de venta del mismo
+    producto en la venta de su compra ('x_sale_order_id' o, si falta, la venta
+    cuyo nombre coincide con el 'origin').
+    """
+    cr.execute("""
+        UPDATE purchase_order_line pol
+           SET x_source_sale_line_id = matched.sale_line_id,
+               x_sale_invoiced_percentage = matched.percentage_invoiced_total
+          FROM (
+                SELECT DISTINCT ON (pol.id)
+                       pol.id AS purchase_line_id,
+                       sol.id AS sale_line_id,
+                       sol.percentage_invoiced_total
+                  FROM purchase_order_line pol
+                  JOIN purchase_order po ON po.id = pol.order_id
+                  JOIN sale_order so
+                    ON so.id = po.x_sale_order_id
+                    OR (po.x_sale_order_id IS NULL AND so.name = po.origin)
+                  JOIN sale_order_line sol
+                    ON sol.order_id = so.id
+                   AND sol.product_id = pol.product_id
+                   AND sol.display_type IS NULL
+                 WHERE pol.x_source_sale_line_id IS NULL
+                   AND pol.display_type IS NULL
+              ORDER BY pol.id, sol.sequence, sol.id
+               ) matched
+         WHERE matched.purchase_line_id = pol.id
+    """)
+    _logger.info("x_source_sale_line_id rellenado en %s líneas de compra.", cr.rowcount)
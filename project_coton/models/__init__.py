@@ -3,3 +3,5 @@
 from . import gastos_purchase
 from . import project_coton
 from . import gastos_coton
+from . import account_move
+from . import res_currency
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo import models, api
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    def _get_paid_ratios(self):
+        """
+        Devuelve {id factura: proporción pagada}, calculada sobre los totales (con IVA).
+        Los importes de todas las facturas se leen de una sola vez.
+        """
+        ratios = {}
+        for values in self.read(['amount_total_signed', 'amount_residual_signed']):
+            ratio = 0.0
+            # Usamos amount_total_signed para manejar correctamente notas de crédito
+            if values['amount_total_signed']:
+                amount_paid = values['amount_total_signed'] - values['amount_residual_signed']
+                ratio = amount_paid / values['amount_total_signed']
+            ratios[values['id']] = ratio
+        return ratios
+
+    def _prepare_paid_amount_tracking(self):
+        """
+        Se llama ANTES de cambiar una conciliación: guarda la proporción pagada de
+        las facturas publicadas y fija los importes cobrados actuales de sus
+        líneas de venta, para después aplicar solo la diferencia.
+        Las líneas de compra no pasan por aquí: su motor de importes
+        (_compute_purchase_payment_amounts) ya se recalcula con los pagos.
+        """
+        invoices = self.filtered(lambda move: move.state == 'posted' and move.is_invoice(include_receipts=True))
+        if not invoices:
+            return {}
+        invoices.invoice_line_ids.sale_line_ids.mapped('amount_paid_line')
+        return {'invoices': invoices, 'ratios': invoices._get_paid_ratios()}
+
+    def _apply_paid_amount_tracking(self, tracking):
+        """
+        Se llama DESPUÉS de cambiar una conciliación: aplica la variación de la
+        proporción pagada de cada factura solo a sus propias líneas de venta.
+        """
+        if not tracking:
+            return
+        invoices = tracking['invoices']
+        ratios_before = tracking['ratios']
+        ratios_after = invoices._get_paid_ratios()
+
+        sale_deltas = defaultdict(float)
+        for invoice in invoices:
+            delta = ratios_after[invoice.id] - ratios_before[invoice.id]
+            if not delta:
+                continue
+            for invoice_line in invoice.invoice_line_ids:
+                # Misma regla que el cálculo completo: proporción sobre el importe SIN IVA
+                amount = invoice_line.price_subtotal * delta
+                for sale_line in invoice_line.sale_line_ids:
+                    sale_deltas[sale_line] += amount
+
+        # Una escritura por importe resultante (redondeado a la moneda, como al
+        # guardarlo) en lugar de una por línea
+        lines_by_amount = defaultdict(list)
+        for line, delta in sale_deltas.items():
+            lines_by_amount[line.currency_id.round(line.amount_paid_line + delta)].append(line.id)
+        for amount, line_ids in lines_by_amount.items():
+            self.env['sale.order.line'].sudo().browse(line_ids).write({'amount_paid_line': amount})
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    # Los importes cobrados por línea de venta se actualizan con cada conciliación,
+    # en lugar de depender de amount_residual_signed de las facturas.
+    @api.model_create_multi
+    def create(self, vals_list):
+        move_line_ids = {
+            vals[key]
+            for vals in vals_list
+            for key in ('debit_move_id', 'credit_move_id')
+            if vals.get(key)
+        }
+        moves = self.env['account.move.line'].browse(move_line_ids).move_id
+        tracking = moves._prepare_paid_amount_tracking()
+        partials = super().create(vals_list)
+        moves._apply_paid_amount_tracking(tracking)
+        return partials
+
+    def unlink(self):
+        moves = (self.debit_move_id | self.credit_move_id).move_id
+        tracking = moves._prepare_paid_amount_tracking()
+        res = super().unlink()
+        moves._apply_paid_amount_tracking(tracking)
+        return res
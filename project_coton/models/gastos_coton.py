@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, tools
+import hashlib
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+# Minutos que pueden pasar sin refrescar la vista materializada si no se
+# configura 'project_coton.unified_line_max_staleness'.
+DEFAULT_MAX_STALENESS = 15
 
 
 class ProjectUnifiedLine(models.Model):
@@ -8,6 +15,10 @@ class ProjectUnifiedLine(models.Model):
     _description = 'Línea Unificada de Venta/Compra para Proyectos (Corregida)'
     _auto = False
 
+    # La vista es MATERIALIZADA: leerla solo recorre las líneas del proyecto
+    # (índice en project_id). Se refresca desde un cron, respetando el margen de
+    # desactualización configurado, o a petición desde el proyecto.
+
     # Los campos del modelo no cambian
     project_id = fields.Many2one(
         'project.project',
@@ -17,6 +28,12 @@ class ProjectUnifiedLine(models.Model):
         index=True
     )
     reference = fields.Char(string='Referencia (Venta)', readonly=True)
+    sale_state = fields.Selection(
+        selection=[('draft', 'Presupuesto'), ('sent', 'Presupuesto Enviado'),
+                   ('sale', 'Pedido de Venta'), ('done', 'Bloqueado'), ('cancel', 'Cancelado')],
+        string='Estado Venta',
+        readonly=True,
+    )
     line_description = fields.Char(string='Descripción', readonly=True)
     currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
     quantity = fields.Float(string='Cantidad', readonly=True)
@@ -30,32 +47,29 @@ class ProjectUnifiedLine(models.Model):
     purchase_paid_percentage = fields.Float(string='% Pagado', readonly=True, group_operator="avg")
     purchase_paid_amount = fields.Monetary(string='Importe Pagado', readonly=True)
 
-    def _auto_init(self):
-        tools.drop_view_if_exists(self.env.cr, self._table)
+    def _get_unified_view_state(self):
+        """ Devuelve (tipo de relación, comentario) de la vista actual, o (None, None) si no existe. """
         self.env.cr.execute("""
-            CREATE OR REPLACE VIEW %s AS (
-                -- =========================================================================
-                --  El CTE se mantiene igual porque todavía se necesita para calcular
-                --  los totales de compra facturados y pagados.
-                -- =========================================================================
-                WITH
-                aggregated_purchase_data AS (
-                    SELECT
-                        po.origin,
-                        pol.product_id,
-                        SUM(pol.price_subtotal) AS total_purchase_amount,
-                        SUM(pol.price_subtotal * pol.percentage_invoiced) AS total_purchase_invoiced,
-                        SUM(pol.amount_paid_line) AS total_purchase_paid
-                    FROM purchase_order_line pol
-                    JOIN purchase_order po ON pol.order_id = po.id
-                    WHERE po.origin IS NOT NULL AND pol.display_type IS NULL
-                    GROUP BY po.origin, pol.product_id
-                )
-                -- 2. Ensamblaje Final
+            SELECT relkind, obj_description(oid, 'pg_class')
+            FROM pg_class WHERE relname = %s
+        """, (self._table,))
+        return self.env.cr.fetchone() or (None, None)
+
+    def _drop_unified_view(self, relkind):
+        """ Elimina la vista anterior, tanto si era normal como materializada. """
+        if relkind == 'm':
+            self.env.cr.execute("DROP MATERIALIZED VIEW IF EXISTS %s" % self._table)
+        elif relkind == 'v':
+            self.env.cr.execute("DROP VIEW IF EXISTS %s" % self._table)
+
+    def _get_unified_line_query(self):
+        """ Consulta que alimenta la vista materializada. """
+        return """
                 SELECT
                     sol.id,
                     so.project_id,
                     so.name AS reference,
+                    so.state AS sale_state,
                     sol.name AS line_description,
                     sol.product_uom_qty AS quantity,
                     so.currency_id,
@@ -78,7 +92,7 @@ class ProjectUnifiedLine(models.Model):
                     -- ======================================================================
                     (COALESCE(sol.provider_cost, 0) * sol.product_uom_qty) AS purchase_amount,
 
-                    -- El resto de campos de compra siguen usando el CTE como antes
+                    -- El resto de campos de compra salen de las líneas de compra enlazadas
                     COALESCE(apd.total_purchase_invoiced, 0) AS purchase_total_invoiced,
                     COALESCE(apd.total_purchase_paid, 0) AS purchase_paid_amount,
                     CASE
@@ -90,11 +104,63 @@ class ProjectUnifiedLine(models.Model):
                 FROM
                     sale_order_line sol
                 JOIN sale_order so ON sol.order_id = so.id
-                -- El JOIN se mantiene para los otros cálculos de compra
-                LEFT JOIN aggregated_purchase_data apd ON apd.origin = so.name AND apd.product_id = sol.product_id
+                -- Totales de las líneas de compra generadas desde ESTA línea de venta.
+                -- Se une por clave (índice en x_source_sale_line_id) y no por origen y
+                -- producto, así un producto repetido en el pedido no se cuenta dos veces.
+                LEFT JOIN LATERAL (
+                    SELECT
+                        SUM(pol.price_subtotal * pol.percentage_invoiced) AS total_purchase_invoiced,
+                        SUM(pol.amount_paid_line) AS total_purchase_paid
+                    FROM purchase_order_line pol
+                    WHERE pol.x_source_sale_line_id = sol.id AND pol.display_type IS NULL
+                ) apd ON TRUE
 
                 WHERE
                     so.project_id IS NOT NULL
                     AND sol.display_type IS NULL
-            )
-        """ % self._table)
\ No newline at end of file
+        """
+
+    def _auto_init(self):
+        # Solo se (re)crea la vista si no existe o si ha cambiado su consulta: la
+        # huella de la consulta se guarda como comentario de la vista.
+        query = self._get_unified_line_query()
+        signature = hashlib.sha1(query.encode()).hexdigest()
+        relkind, comment = self._get_unified_view_state()
+        if relkind == 'm' and comment == signature:
+            return
+        self._drop_unified_view(relkind)
+        self.env.cr.execute("CREATE MATERIALIZED VIEW %s AS (%s)" % (self._table, query))
+        # El índice único es obligatorio para REFRESH ... CONCURRENTLY.
+        self.env.cr.execute("CREATE UNIQUE INDEX %s_id_uniq ON %s (id)" % (self._table, self._table))
+        self.env.cr.execute("CREATE INDEX %s_project_id_idx ON %s (project_id)" % (self._table, self._table))
+        self.env.cr.execute("COMMENT ON MATERIALIZED VIEW %s IS %%s" % self._table, (signature,))
+        # La vista se acaba de llenar con los datos actuales
+        self.env['ir.config_parameter'].sudo().set_param(
+            'project_coton.unified_line_last_refresh', fields.Datetime.to_string(fields.Datetime.now()))
+
+    @api.model
+    def _refresh_unified_lines(self, force=False):
+        """
+        Refresca la vista materializada sin bloquear las lecturas.
+        Sin 'force', solo se refresca si el último refresco es más antiguo que el
+        margen configurado en 'project_coton.unified_line_max_staleness' (minutos).
+        Devuelve True si se ha refrescado.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        now = fields.Datetime.now()
+        if not force:
+            max_staleness = int(params.get_param('project_coton.unified_line_max_staleness', DEFAULT_MAX_STALENESS))
+            last_refresh = params.get_param('project_coton.unified_line_last_refresh')
+            if last_refresh and fields.Datetime.to_datetime(last_refresh) + timedelta(minutes=max_staleness) > now:
+                return False
+
+        # Las líneas de venta y compra pendientes de guardar deben estar en la base de datos.
+        self.env.flush_all()
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY %s" % self._table)
+        self.env.invalidate_all()
+        params.set_param('project_coton.unified_line_last_refresh', fields.Datetime.to_string(now))
+        return True
+
+    @api.model
+    def _cron_refresh_unified_lines(self):
+        self._refresh_unified_lines()
@@ -108,35 +108,57 @@ class PurchaseOrderLine(models.Model):
     #    Este es el campo que has solicitado.
     percentage_paid = fields.Float(
         string='% Pagado (Compra)',
-        compute='_compute_purchase_percentage',
+        compute='_compute_purchase_payment_amounts',
         store=True,
         readonly=True,
         digits=(16, 2),
         help="Porcentaje del total de la línea (price_subtotal) que ha sido pagado."
     )
 
-    @api.depends('invoice_lines',
+    @api.depends('price_subtotal',
+                 'invoice_lines',
                  'invoice_lines.move_id.state',
                  'invoice_lines.move_id.payment_state',
                  'invoice_lines.move_id.amount_total',
                  'invoice_lines.move_id.amount_residual')
     def _compute_purchase_payment_amounts(self):
         """
-        Calcula el importe total facturado y el importe total pagado
-        para esta línea de pedido de compra.
+        Motor único de importes de facturación y pago de las líneas de compra.
+        Carga de una vez las líneas de factura y las facturas de todo el lote y
+        calcula en una sola pasada:
+        - amount_invoiced: total (base) de las facturas de proveedor publicadas.
+        - amount_paid: parte pagada de esas facturas, prorrateada por línea.
+        - amount_paid_line: igual, pero con los importes con signo e incluyendo
+          rectificativas y recibos de proveedor.
+        - percentage_paid: amount_paid sobre el subtotal de la línea de compra.
         """
+        bill_lines = self.invoice_lines
+        bill_lines.fetch(['price_subtotal', 'move_id'])
+        bill_lines.move_id.fetch([
+            'state', 'move_type', 'payment_state',
+            'amount_total', 'amount_residual', 'amount_total_signed', 'amount_residual_signed',
+        ])
+
         for line in self:
             total_invoiced_amount = 0.0
             total_paid_amount = 0.0
+            total_paid_on_line = 0.0
 
-            # Filtramos solo facturas de proveedor (in_invoice) que estén publicadas
-            posted_bill_lines = line.invoice_lines.filtered(
-                lambda l: l.move_id.state == 'posted' and l.move_id.move_type == 'in_invoice'
-            )
-
-            for bill_line in posted_bill_lines:
+            for bill_line in line.invoice_lines:
                 bill = bill_line.move_id
 
+                # Solo consideramos facturas de proveedor publicadas
+                if bill.state != 'posted' or not bill.move_type.startswith('in_'):
+                    continue
+
+                # Importe pagado con signo (rectificativas incluidas) SIN IMPUESTOS
+                if bill.amount_total_signed:
+                    paid_ratio = (bill.amount_total_signed - bill.amount_residual_signed) / bill.amount_total_signed
+                    total_paid_on_line += bill_line.price_subtotal * paid_ratio
+
+                if bill.move_type != 'in_invoice':
+                    continue
+
                 # 1. Sumar el total facturado (base)
                 #    Usamos 'price_subtotal' de la línea de factura
                 total_invoiced_amount += bill_line.price_subtotal
@@ -156,17 +178,12 @@ class PurchaseOrderLine(models.Model):
 
             line.amount_invoiced = total_invoiced_amount
             line.amount_paid = total_paid_amount
+            line.amount_paid_line = total_paid_on_line
 
-    @api.depends('amount_paid', 'price_subtotal')
-    def _compute_purchase_percentage(self):
-        """
-        Calcula el porcentaje pagado sobre el total de la línea de compra (price_subtotal).
-        """
-        for line in self:
+            # Usamos 'price_subtotal' (total sin impuestos de la línea de PO)
+            # como el 100% esperado.
             if line.price_subtotal > 0:
-                # Usamos 'price_subtotal' (total sin impuestos de la línea de PO)
-                # como el 100% esperado.
-                line.percentage_paid = (line.amount_paid / line.price_subtotal) * 100
+                line.percentage_paid = (total_paid_amount / line.price_subtotal) * 100
             else:
                 line.percentage_paid = 0.0
 
@@ -236,7 +253,9 @@ class PurchaseOrder(models.Model):
         """
         Calcula el porcentaje total cobrado de las ventas asociadas
         agregando los importes de las líneas y convirtiendo moneda.
+        Las tasas de cambio se consultan una sola vez para todo el lote.
         """
+        rate_cache = {}
         for po in self:
             total_paid_in_po_currency = 0.0
             total_line_in_po_currency = 0.0
@@ -251,11 +270,12 @@ class PurchaseOrder(models.Model):
                 # --- Convertir el importe pagado de la línea de venta ---
                 if sale_currency and sale_currency != po_currency:
                     # Usamos _convert para cambiar de la moneda de venta a la moneda de compra
-                    total_paid_in_po_currency += sale_currency._convert(
+                    total_paid_in_po_currency += sale_currency._convert_cached(
                         line.x_sale_paid_amount,
                         po_currency,
                         po.company_id,
-                        po.date_order or fields.Date.today()
+                        po.date_order or fields.Date.today(),
+                        rate_cache,
                     )
                 else:
                     # Las monedas son iguales o no hay moneda de venta
@@ -263,11 +283,12 @@ class PurchaseOrder(models.Model):
 
                 # --- Convertir el importe total de la línea de venta ---
                 if sale_currency and sale_currency != po_currency:
-                    total_line_in_po_currency += sale_currency._convert(
+                    total_line_in_po_currency += sale_currency._convert_cached(
                         line.x_sale_line_total,
                         po_currency,
                         po.company_id,
-                        po.date_order or fields.Date.today()
+                        po.date_order or fields.Date.today(),
+                        rate_cache,
                     )
                 else:
                     total_line_in_po_currency += line.x_sale_line_total
@@ -24,6 +24,10 @@ class ProjectProject(models.Model):
         readonly=True
     )
 
+    def action_refresh_unified_lines(self):
+        """ Refresca a petición el análisis económico por línea. """
+        self.env['project.unified.line']._refresh_unified_lines(force=True)
+        return True
 
 
 class SaleOrderLine(models.Model):
@@ -38,7 +42,9 @@ class SaleOrderLine(models.Model):
              "calculada proporcionalmente a los pagos de las facturas asociadas."
     )
 
-    @api.depends('invoice_lines.move_id.state', 'invoice_lines.move_id.amount_residual_signed')
+    # Los pagos no forman parte de las dependencias: cada conciliación aplica su
+    # variación a las líneas afectadas (ver account_move.py).
+    @api.depends('invoice_lines.move_id.state')
     def _compute_amount_paid_line(self):
         """
         Calcula el importe pagado SIN IVA para una línea de pedido de venta específica.
@@ -47,6 +53,9 @@ class SaleOrderLine(models.Model):
         Para cada factura, calcula qué porcentaje ha sido pagado y aplica ese
         porcentaje al valor SIN IVA de la línea de factura correspondiente.
         """
+        # La proporción de pago de las facturas se calcula sobre los totales (con IVA),
+        # leyendo todas las facturas de una vez.
+        payment_ratios = self.invoice_lines.move_id._get_paid_ratios()
         for line in self:
             total_paid_on_line = 0.0
 
@@ -58,13 +67,7 @@ class SaleOrderLine(models.Model):
                 if invoice.state != 'posted':
                     continue
 
-                # La proporción de pago de la factura se calcula sobre los totales (con IVA)
-                # Esta lógica es correcta y no necesita cambios.
-                payment_ratio = 0.0
-                # Usamos amount_total_signed para manejar correctamente notas de crédito
-                if invoice.amount_total_signed != 0:
-                    amount_paid_on_invoice = invoice.amount_total_signed - invoice.amount_residual_signed
-                    payment_ratio = amount_paid_on_invoice / invoice.amount_total_signed
+                payment_ratio = payment_ratios[invoice.id]
 
                 # =========================================================================
                 # ¡CAMBIO CLAVE AQUÍ!
@@ -81,44 +84,13 @@ class PurchaseOrderLine(models.Model):
     _inherit = 'purchase.order.line'
 
     # ¡NUEVO CAMPO PARA COMPRAS!
+    # Lo calcula el mismo motor que los importes facturados/pagados de la línea
+    # (ver _compute_purchase_payment_amounts en gastos_purchase.py).
     amount_paid_line = fields.Monetary(
         string="Importe Pagado",
-        compute='_compute_amount_paid_line',
+        compute='_compute_purchase_payment_amounts',
         store=True,
         readonly=True,
         help="Cantidad total (sin IVA) que ha sido pagada al proveedor por esta línea específica, "
              "calculada proporcionalmente a los pagos de las facturas asociadas."
     )
-
-    @api.depends('invoice_lines.move_id.state', 'invoice_lines.move_id.amount_residual_signed')
-    def _compute_amount_paid_line(self):
-        """
-        Calcula el importe pagado SIN IVA para una línea de pedido de compra específica.
-
-        Itera sobre todas las líneas de factura de proveedor asociadas. Para cada factura,
-        calcula qué porcentaje ha sido pagado y aplica ese porcentaje al valor
-        SIN IVA de la línea de factura correspondiente.
-        """
-        for line in self:
-            total_paid_on_line = 0.0
-
-            # Recorremos todas las líneas de factura de proveedor creadas desde esta línea de compra
-            for invoice_line in line.invoice_lines:
-                bill = invoice_line.move_id  # 'bill' es más claro para facturas de proveedor
-
-                # Solo consideramos facturas confirmadas ('posted')
-                # y que sean del tipo correcto (facturas de proveedor)
-                if bill.state != 'posted' or not bill.move_type.startswith('in_'):
-                    continue
-
-                # Calculamos la proporción de pago de la factura
-                payment_ratio = 0.0
-                if bill.amount_total_signed != 0:
-                    amount_paid_on_bill = bill.amount_total_signed - bill.amount_residual_signed
-                    payment_ratio = amount_paid_on_bill / bill.amount_total_signed
-
-                # Aplicamos esa proporción al valor de la línea de factura SIN IMPUESTOS
-                # La lógica es idéntica a la de ventas: usamos price_subtotal
-                total_paid_on_line += invoice_line.price_subtotal * payment_ratio
-
-            line.amount_paid_line = total_paid_on_line
\ No newline at end of file
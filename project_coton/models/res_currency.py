@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class ResCurrency(models.Model):
+    _inherit = 'res.currency'
+
+    def _convert_cached(self, from_amount, to_currency, company, date, rate_cache):
+        """
+        Igual que _convert, pero reutiliza las tasas ya consultadas.
+
+        'rate_cache' es un diccionario que crea quien llama y que vive lo que dura
+        una petición o un lote de cálculo. Se indexa por
+        (moneda origen, moneda destino, compañía, fecha).
+        """
+        # Como en _convert, una moneda vacía se toma igual a la otra.
+        self, to_currency = self or to_currency, to_currency or self
+        if self == to_currency:
+            return to_currency.round(from_amount)
+        date = fields.Date.to_date(date) or fields.Date.today()
+        key = (self.id, to_currency.id, company.id, date)
+        if key not in rate_cache:
+            rate_cache[key] = self._get_conversion_rate(self, to_currency, company, date)
+        return to_currency.round(from_amount * rate_cache[key])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestUnifiedLineQuery(TransactionCase):
+    """
+    Regresión del plan de la vista de líneas unificadas: filtrada por proyecto
+    debe usar índices y no recorrer secuencialmente las líneas de compra.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Cliente Plan'})
+        cls.supplier = cls.env['res.partner'].create({'name': 'Proveedor Plan'})
+        cls.products = cls.env['product.product'].create([
+            {'name': 'Producto Plan %s' % index, 'purchase_ok': True}
+            for index in range(20)
+        ])
+        cls.projects = cls.env['project.project'].create([
+            {'name': 'Proyecto Plan %s' % index} for index in range(10)
+        ])
+        # Un pedido de venta por proyecto y una compra enlazada por línea de venta
+        orders = cls.env['sale.order'].create([{
+            'partner_id': cls.partner.id,
+            'project_id': project.id,
+            'order_line': [(0, 0, {'product_id': product.id, 'product_uom_qty': 2, 'price_unit': 10.0})
+                           for product in cls.products],
+        } for project in cls.projects])
+        cls.env['purchase.order'].create([{
+            'partner_id': cls.supplier.id,
+            'x_sale_order_id': order.id,
+            'order_line': [(0, 0, {
+                'product_id': line.product_id.id,
+                'product_qty': line.product_uom_qty,
+                'price_unit': 5.0,
+                'date_planned': fields.Datetime.now(),
+                'name': line.product_id.display_name,
+                'x_source_sale_line_id': line.id,
+            }) for line in order.order_line],
+        } for order in orders])
+        cls.env.flush_all()
+        cls.env['project.unified.line']._refresh_unified_lines(force=True)
+        cls.env.cr.execute("ANALYZE purchase_order_line")
+        cls.env.cr.execute("ANALYZE project_unified_line")
+
+    def _explain(self, query, params):
+        # Con pocas filas PostgreSQL prefiere siempre el recorrido secuencial;
+        # sin él, solo lo usa si no hay un índice aplicable (como con volumen real).
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.env.cr.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = self.env.cr.fetchone()[0][0]['Plan']
+        nodes, pending = [], [plan]
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(node.get('Plans', []))
+        return nodes
+
+    def test_project_filter_uses_project_index(self):
+        UnifiedLine = self.env['project.unified.line']
+        nodes = self._explain(
+            "SELECT * FROM %s WHERE project_id = %%s" % UnifiedLine._table, [self.projects[0].id])
+        index_names = {node.get('Index Name') for node in nodes}
+        self.assertIn('%s_project_id_idx' % UnifiedLine._table, index_names)
+
+    def test_view_query_does_not_seq_scan_purchase_lines(self):
+        UnifiedLine = self.env['project.unified.line']
+        nodes = self._explain(
+            "SELECT * FROM (%s) unified WHERE unified.project_id = %%s" % UnifiedLine._get_unified_line_query(),
+            [self.projects[0].id],
+        )
+        seq_scans = [
+            node for node in nodes
+            if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') == 'purchase_order_line'
+        ]
+        self.assertFalse(seq_scans, "La consulta recorre secuencialmente purchase_order_line.")
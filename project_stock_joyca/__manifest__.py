@@ -20,14 +20,19 @@
     'website': "https://www.tuweb.com",
     "version": "18.0.1.0.0",
     'sequence': 0,
-    "depends": ['project', 'stock', 'account', 'sale_project', 'sale_timesheet','hr_timesheet'],
+    "depends": ['project', 'stock', 'project_stock', 'account', 'sale_project', 'sale_timesheet','hr_timesheet', 'project_coton'],
     "data": [
+        "security/ir.model.access.csv",
+        "data/cron_data.xml",
         "views/project_views.xml",
+        "views/project_financial_snapshot_views.xml",
+        "views/stock_move_revaluation_views.xml",
         "views/view_account_analytic_line.xml",
     ],
 
     'assets': {
         'web.assets_backend': [
+            'project_stock_joyca/static/src/js/project_panel.js',
             'project_stock_joyca/static/src/xml/project_panel.xml',
         ],
     },
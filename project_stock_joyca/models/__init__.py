@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
 from . import picking_project
 from . import stock_joyca_mrp
-from . import project_timesheets
\ No newline at end of file
+from . import project_timesheets
+from . import project_financial_snapshot
+from . import sale_account_panel
+from . import stock_move_revaluation
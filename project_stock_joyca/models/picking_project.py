@@ -1,10 +1,38 @@
 # -*- coding: utf-8 -*-
+import json
+
 from odoo import fields, models, api, _
 
+# Movimientos por página en el detalle de materiales del panel.
+PANEL_STOCK_MOVES_PAGE_SIZE = 20
+
+# Clave en cr.precommit.data con los proyectos cuya caché del panel caduca
+# al confirmar la transacción.
+PANEL_CACHE_STALE_KEY = 'project_stock_joyca.panel_cache_stale'
+
 
 class Project(models.Model):
     _inherit = "project.project"
 
+    # --- CACHÉ DEL PANEL ---
+    # Datos del panel lateral del proyecto: {'date': 'AAAA-MM-DD', 'data': {...}}.
+    # Se calcula como superusuario (igual para todos los que pueden leer el
+    # proyecto), caduca al cambiar de día (tasas de cambio) y se vacía al
+    # confirmar las transacciones que cambian los campos que lee el panel en
+    # pedidos, facturas, partes de horas y movimientos de stock.
+    x_panel_cache = fields.Json(
+        string='Caché del Panel',
+        copy=False,
+        prefetch=False,
+    )
+    # Proyecto con cambios que la tarea de fotos diarias aún no ha recogido
+    # (incluye borrados y cambios de proyecto, que no dejan write_date). Se
+    # marca junto con la caducidad de la caché del panel.
+    x_snapshot_dirty = fields.Boolean(
+        string='Foto Pendiente',
+        copy=False,
+    )
+
     # --- CAMPO CALCULADO ---
 
     stock_move_count = fields.Integer(
@@ -14,12 +42,14 @@ class Project(models.Model):
 
     def _compute_stock_move_count(self):
         """
-        Calcula el número de movimientos de stock asociados al proyecto.
+        Calcula el número de movimientos de stock asociados a los proyectos,
+        con una sola consulta agrupada para todo el conjunto.
         """
+        counts = dict(self.env['stock.move']._read_group(
+            [('x_project_id', 'in', self.ids)], ['x_project_id'], ['__count'],
+        ))
         for project in self:
-            project.stock_move_count = self.env['stock.move'].search_count([
-                ('picking_id.project_id', '=', project.id)
-            ])
+            project.stock_move_count = counts.get(project._origin, 0)
 
     # --- PASO 1: AÑADIR LOS METADATOS DEL BOTÓN ---
 
@@ -71,7 +101,7 @@ class Project(models.Model):
             'type': 'ir.actions.act_window',
             'res_model': 'stock.move',
             'view_mode': 'list,form',
-            'domain': [('picking_id.project_id', '=', self.id)],
+            'domain': [('x_project_id', '=', self.id)],
             'context': {'default_project_id': self.id},
         }
 
@@ -86,178 +116,304 @@ class Project(models.Model):
 
         return labels
 
+    @api.model
+    def _invalidate_panel_cache(self, project_ids):
+        """
+        Marca como caducada la caché del panel de los proyectos indicados.
+        La caché se vacía en el precommit, con una sola UPDATE por transacción,
+        para no bloquear la fila del proyecto en cada escritura.
+        """
+        project_ids = {project_id for project_id in project_ids if project_id}
+        if not project_ids:
+            return
+        precommit = self.env.cr.precommit
+        stale_ids = precommit.data.get(PANEL_CACHE_STALE_KEY)
+        if stale_ids is None:
+            stale_ids = precommit.data[PANEL_CACHE_STALE_KEY] = set()
+            precommit.add(self._flush_panel_cache_invalidation)
+        stale_ids.update(project_ids)
+
+    @api.model
+    def _flush_panel_cache_invalidation(self):
+        """
+        Vacía por SQL (sin tocar write_date) las cachés marcadas como caducadas
+        y deja los proyectos pendientes de foto diaria.
+        """
+        project_ids = list(self.env.cr.precommit.data.pop(PANEL_CACHE_STALE_KEY, ()))
+        if not project_ids:
+            return
+        self.env.cr.execute("""
+            UPDATE project_project SET x_panel_cache = NULL, x_snapshot_dirty = TRUE
+            WHERE id = ANY(%s) AND (x_panel_cache IS NOT NULL OR x_snapshot_dirty IS NOT TRUE)
+        """, [project_ids])
+        self.browse(project_ids).invalidate_recordset(['x_panel_cache', 'x_snapshot_dirty'])
+
+    def _is_panel_cache_stale(self):
+        """ La caché del proyecto se ha invalidado en la transacción en curso. """
+        self.ensure_one()
+        return self.id in self.env.cr.precommit.data.get(PANEL_CACHE_STALE_KEY, ())
+
     def _get_panel_sale_orders(self):
         """
         Busca y formatea los PEDIDOS de venta (agrupados) para el panel.
+        Una sola consulta devuelve los pedidos y su importe facturado.
         """
         self.ensure_one()
-
-        # Buscamos los Pedidos de Venta vinculados a este proyecto
-        sale_orders = self.env['sale.order'].search([
-            ('project_id', '=', self.id),
-            ('state', 'in', ['sale', 'done']),
-        ])
+        # amount_untaxed_signed maneja correctamente facturas y abonos;
+        # solo se tienen en cuenta las facturas publicadas (posted).
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT so.id, so.name, so.amount_untaxed, so.currency_id, so.date_order,
+                   COALESCE(SUM(inv.amount_untaxed_signed), 0.0)
+            FROM sale_order so
+            LEFT JOIN LATERAL (
+                SELECT DISTINCT am.id, am.amount_untaxed_signed
+                FROM sale_order_line sol
+                JOIN sale_order_line_invoice_rel rel ON rel.order_line_id = sol.id
+                JOIN account_move_line aml ON aml.id = rel.invoice_line_id
+                JOIN account_move am ON am.id = aml.move_id
+                WHERE sol.order_id = so.id AND am.state = 'posted'
+            ) inv ON TRUE
+            WHERE so.project_id = %s AND so.state IN ('sale', 'done')
+            GROUP BY so.id
+            ORDER BY so.date_order DESC, so.id DESC
+        """, [self.id])
 
         so_data = []
-        for order in sale_orders:
-            # 1. Total del pedido (usamos el subtotal sin impuestos)
-            total_amount = order.amount_untaxed
-
-            # 2. Calcular el importe total facturado (sin impuestos)
-            invoiced_amount = 0.0
-
-            # Filtramos facturas publicadas (posted)
-            posted_invoices = order.invoice_ids.filtered(
-                lambda m: m.state == 'posted'
-            )
-            for inv in posted_invoices:
-                # amount_untaxed_signed maneja correctamente facturas y abonos
-                invoiced_amount += inv.amount_untaxed_signed
-
+        for order_id, name, total_amount, currency_id, date_order, invoiced_amount in self.env.cr.fetchall():
             so_data.append({
-                'id': order.id,
-                'sale_order_name': order.name,
+                'id': order_id,
+                'sale_order_name': name,
                 'total_amount': total_amount,
                 'invoiced_amount': invoiced_amount,
-                'currency_id': order.currency_id.id,
-                'date_order': order.date_order,
+                'currency_id': currency_id,
+                'date_order': date_order,
             })
         return so_data
 
-    def _get_panel_timesheet_totals(self):
+    def _get_panel_timesheet_totals(self, rate_cache=None, date_from=None, date_to=None):
         """
         Calcula los totales de horas y coste para el panel.
+        Las líneas se agrupan por moneda y día: se convierte una vez por grupo.
+        'rate_cache' permite compartir las tasas de cambio con el resto del panel.
+        'date_from'/'date_to' (opcionales, incluidos) limitan los totales a un periodo.
         """
         self.ensure_one()
-        timesheets = self.env['account.analytic.line'].search([
-            ('project_id', '=', self.id),
-            ('employee_id', '!=', False),
-        ])
-
-        total_hours = 0.0
-        total_cost = 0.0
+        rate_cache = {} if rate_cache is None else rate_cache
         # Usaremos la moneda del proyecto como moneda de destino
         project_currency = self.currency_id
+        company = self.company_id or self.env.company
 
-        for line in timesheets:
-            # Sumar las horas
-            total_hours += line.unit_amount
-
-            # Sumar el coste, convirtiendo la moneda si es necesario
-            line_cost = line.x_coste
-            if line.currency_id and line.currency_id != project_currency:
-                # Convertir el coste de la línea a la moneda del proyecto
-                total_cost += line.currency_id._convert(
-                    line_cost,
-                    project_currency,
-                    self.company_id or self.env.company,
-                    line.date or fields.Date.today()
-                )
-            else:
-                # La moneda es la misma (o no hay moneda), sumar directamente
-                total_cost += line_cost
+        domain = [('project_id', '=', self.id), ('employee_id', '!=', False)]
+        if date_from:
+            domain.append(('date', '>=', date_from))
+        if date_to:
+            domain.append(('date', '<=', date_to))
+
+        total_hours = 0.0
+        total_cost = 0.0
+        for currency, date, hours, cost in self.env['account.analytic.line']._read_group(
+                domain,
+                ['currency_id', 'date:day'],
+                ['unit_amount:sum', 'x_coste:sum']):
+            total_hours += hours
+            # Convertir el coste del grupo a la moneda del proyecto
+            total_cost += currency._convert_cached(
+                cost, project_currency, company, date or fields.Date.today(), rate_cache)
 
         # Devolvemos un solo diccionario con los totales
         return {
             'total_hours': total_hours,
             'total_cost': total_cost,
             'currency_id': project_currency.id,
+            'date_from': date_from and fields.Date.to_string(fields.Date.to_date(date_from)),
+            'date_to': date_to and fields.Date.to_string(fields.Date.to_date(date_to)),
         }
 
+    def get_panel_timesheet_totals(self, date_from=None, date_to=None):
+        """
+        Totales de horas y coste de un periodo para el panel (llamada desde el cliente).
+        No usa la caché del panel, que guarda solo los totales de todo el proyecto.
+        """
+        self.ensure_one()
+        self.check_access('read')
+        return self._get_panel_timesheet_totals(date_from=date_from, date_to=date_to)
+
+    def _get_panel_stock_move_domain(self):
+        self.ensure_one()
+        return [('x_project_id', '=', self.id), ('state', '=', 'done')]
+
     def _get_panel_stock_moves(self):
         """
-        Busca y formatea los movimientos de stock (materiales) para el panel.
+        Resumen de los materiales (movimientos hechos) del panel, agrupado por
+        producto y moneda. El detalle se pide por páginas con
+        get_panel_stock_moves_page, sin enviar nunca la lista completa.
+        """
+        self.ensure_one()
+        summary = []
+        for product, currency, quantity, cost, count in self.env['stock.move']._read_group(
+                self._get_panel_stock_move_domain(),
+                ['product_id', 'currency_id'],
+                ['product_qty:sum', 'x_coste_total:sum', '__count'],
+                order='x_coste_total:sum desc'):
+            summary.append({
+                'id': '%s-%s' % (product.id, currency.id),
+                'product_id': product.id,
+                'product_name': product.display_name,
+                'quantity': quantity,  # En la unidad del producto
+                'product_uom': product.uom_id.name,
+                'cost': cost,
+                'currency_id': currency.id,
+                'move_count': count,
+            })
+        return summary
+
+    def get_panel_stock_moves_page(self, offset=0, limit=PANEL_STOCK_MOVES_PAGE_SIZE):
+        """
+        Página del detalle de movimientos de materiales para el panel
+        (llamada desde el cliente bajo demanda).
         """
         self.ensure_one()
-        stock_moves = self.env['stock.move'].search([
-            ('picking_id.project_id', '=', self.id),
-            ('state', '=', 'done')
-        ])
+        self.check_access('read')
+        domain = self._get_panel_stock_move_domain()
+        limit = min(limit or PANEL_STOCK_MOVES_PAGE_SIZE, 200)
+        stock_moves = self.env['stock.move'].search_fetch(
+            domain,
+            ['product_id', 'product_uom_qty', 'product_uom', 'x_coste_total', 'currency_id', 'date'],
+            offset=offset, limit=limit, order='date desc, id desc',
+        )
 
         move_data = []
         for move in stock_moves:
             move_data.append({
                 'id': move.id,
                 'product_name': move.product_id.display_name,
-
-                # --- CORREGIDO ---
                 'quantity_done': move.product_uom_qty,  # Usamos la cantidad hecha
-                # --- FIN CORRECCIÓN ---
-
                 'product_uom': move.product_uom.name,
-
-                # --- CORREGIDO ---
-                'cost': move.x_coste_total,  # Sin la 'e' extra
-                # --- FIN CORRECCIÓN ---
-
+                'cost': move.x_coste_total,
                 'currency_id': move.currency_id.id,
                 'date': move.date,
             })
-        return move_data
+        return {
+            'moves': move_data,
+            'offset': offset,
+            'limit': limit,
+            'total': self.env['stock.move'].search_count(domain),
+        }
 
-    def get_panel_data(self):
+    def _get_panel_material_cost(self, rate_cache=None):
         """
-        Heredamos la función principal para inyectar todos los datos
-        Y AÑADIMOS EL CÁLCULO DEL MARGEN.
+        Coste total de materiales (movimientos hechos) en la moneda del proyecto,
+        agrupado por moneda y día para convertir una vez por grupo.
         """
-        panel_data = super().get_panel_data()
+        self.ensure_one()
+        rate_cache = {} if rate_cache is None else rate_cache
+        project_currency = self.currency_id
+        company = self.company_id or self.env.company
+
+        total_material_cost = 0.0
+        for currency, date, cost in self.env['stock.move']._read_group(
+                self._get_panel_stock_move_domain(),
+                ['currency_id', 'date:day'],
+                ['x_coste_total:sum']):
+            total_material_cost += currency._convert_cached(
+                cost, project_currency, company, date or fields.Date.today(), rate_cache)
+        return total_material_cost
+
+    def _compute_panel_payload(self):
+        """
+        Calcula todos los datos propios del panel Y EL CÁLCULO DEL MARGEN.
+        """
+        self.ensure_one()
+        project_currency = self.currency_id
+        company = self.company_id or self.env.company
+        today = fields.Date.today()  # Fecha de fallback
+        # Tasas de cambio compartidas por todas las conversiones de esta petición
+        rate_cache = {}
+
+        # 1. INGRESOS (Ventas)
+        panel_sale_orders = self._get_panel_sale_orders()
+        total_revenue = 0.0
+        for order in panel_sale_orders:
+            order_currency = self.env['res.currency'].browse(order['currency_id'])
+            total_revenue += order_currency._convert_cached(
+                order['total_amount'],
+                project_currency,
+                company,
+                order.get('date_order') or today,
+                rate_cache,
+            )
 
-        if self.env.user.has_group('project.group_project_user'):
+        # 2. COSTE (Horas) - ya en la moneda del proyecto
+        panel_timesheet_totals = self._get_panel_timesheet_totals(rate_cache)
+        total_hours_cost = panel_timesheet_totals['total_cost']
 
-            project_currency = self.currency_id
-            company = self.company_id or self.env.company
-            today = fields.Date.today()  # Fecha de fallback
-
-            # 1. INGRESOS (Ventas)
-            panel_sale_orders = self._get_panel_sale_orders()
-            panel_data['panel_sale_orders'] = panel_sale_orders
-
-            total_revenue = 0.0
-            for order in panel_sale_orders:
-                order_currency = self.env['res.currency'].browse(order['currency_id'])
-                total_revenue += order_currency._convert(
-                    order['total_amount'],
-                    project_currency,
-                    company,
-                    order.get('date_order', today)
-                )
-
-            # 2. COSTE (Horas)
-            panel_timesheet_totals = self._get_panel_timesheet_totals()
-            panel_data['panel_timesheet_totals'] = panel_timesheet_totals
-            # Este coste ya está en la moneda del proyecto (según nuestra función)
-            total_hours_cost = panel_timesheet_totals['total_cost']
-
-            # 3. COSTE (Materiales)
-            panel_stock_moves = self._get_panel_stock_moves()
-            panel_data['panel_stock_moves'] = panel_stock_moves
-
-            total_material_cost = 0.0
-            for move in panel_stock_moves:
-                move_currency = self.env['res.currency'].browse(move['currency_id'])
-                total_material_cost += move_currency._convert(
-                    move['cost'],
-                    project_currency,
-                    company,
-                    move.get('date', today)
-                )
-
-            # 4. CÁLCULO DEL MARGEN
-            margin_amount = total_revenue - total_hours_cost - total_material_cost
-            margin_percentage = (total_revenue and (margin_amount / total_revenue) * 100) or 0.0
+        # 3. COSTE (Materiales): resumen por producto; el margen usa el total agrupado
+        panel_stock_moves = self._get_panel_stock_moves()
+        total_material_cost = self._get_panel_material_cost(rate_cache)
 
+        # 4. CÁLCULO DEL MARGEN
+        margin_amount = total_revenue - total_hours_cost - total_material_cost
+        margin_percentage = (total_revenue and (margin_amount / total_revenue) * 100) or 0.0
+
+        return {
+            'panel_sale_orders': panel_sale_orders,
+            'panel_timesheet_totals': panel_timesheet_totals,
+            'panel_stock_moves': panel_stock_moves,
+            'panel_stock_move_count': sum(line['move_count'] for line in panel_stock_moves),
             # 5. Guardar datos del margen para el XML
-            panel_data['panel_margin'] = {
+            'panel_margin': {
                 'total_revenue': total_revenue,
                 'total_hours_cost': total_hours_cost,
                 'total_material_cost': total_material_cost,
                 'margin_amount': margin_amount,
                 'margin_percentage': margin_percentage,
                 'currency_id': project_currency.id,
-            }
+            },
+        }
+
+    def _get_panel_payload(self):
+        """
+        Devuelve los datos del panel desde la caché del proyecto; si no hay caché
+        del día, los calcula y la guarda por SQL (sin tocar write_date).
+
+        Se comprueba el acceso de lectura al proyecto y se calcula como
+        superusuario, de modo que la caché no depende de las reglas de
+        registro de quien abre el panel primero.
+        """
+        self.ensure_one()
+        self.check_access('read')
+        project = self.sudo()
+        # Los cálculos pendientes pueden marcar la caché como caducada
+        self.env.flush_all()
+        today = fields.Date.to_string(fields.Date.context_today(self))
+        stale = project._is_panel_cache_stale()
+        cache = project.x_panel_cache
+        if cache and cache.get('date') == today and not stale:
+            return cache['data']
+
+        # Se serializa igual que al enviarlo al navegador (fechas como texto)
+        payload = json.loads(json.dumps(project._compute_panel_payload(), default=str))
+        if not stale:
+            self.env.cr.execute(
+                "UPDATE project_project SET x_panel_cache = %s WHERE id = %s",
+                [json.dumps({'date': today, 'data': payload}), self.id],
+            )
+            self.invalidate_recordset(['x_panel_cache'])
+        return payload
+
+    def get_panel_data(self):
+        """
+        Heredamos la función principal para inyectar todos los datos
+        Y AÑADIMOS EL CÁLCULO DEL MARGEN (ver _compute_panel_payload).
+        """
+        panel_data = super().get_panel_data()
+
+        if self.env.user.has_group('project.group_project_user'):
+            panel_data.update(self._get_panel_payload())
 
             if 'currency_id' not in panel_data:
-                panel_data['currency_id'] = project_currency.id
+                panel_data['currency_id'] = self.currency_id.id
 
         return panel_data
 
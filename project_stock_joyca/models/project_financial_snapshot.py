@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models, api
+
+# Importes que se guardan en cada foto diaria del proyecto.
+SNAPSHOT_AMOUNT_FIELDS = [
+    'revenue', 'invoiced', 'collected', 'purchase_cost', 'paid', 'hours_cost', 'material_cost',
+]
+
+# Estados de venta que cuentan como ingresos (los mismos que el panel).
+PANEL_SALE_STATES = ('sale', 'done')
+
+
+class ProjectFinancialSnapshot(models.Model):
+    """
+    Foto diaria de la rentabilidad de cada proyecto (una fila por proyecto y día)
+    para dibujar tendencias sin recalcular el panel a partir de las líneas.
+    """
+    _name = 'project.financial.snapshot'
+    _description = 'Foto Financiera Diaria del Proyecto'
+    _order = 'date desc, project_id'
+
+    project_id = fields.Many2one('project.project', string='Proyecto', required=True, ondelete='cascade', index=True)
+    date = fields.Date(string='Fecha', required=True, index=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda')
+
+    revenue = fields.Monetary(string='Ingresos')
+    invoiced = fields.Monetary(string='Facturado')
+    collected = fields.Monetary(string='Cobrado')
+    purchase_cost = fields.Monetary(string='Coste de Compra')
+    paid = fields.Monetary(string='Pagado')
+    hours_cost = fields.Monetary(string='Coste Horas')
+    material_cost = fields.Monetary(string='Coste Materiales')
+    margin_amount = fields.Monetary(
+        string='Margen',
+        help="Ingresos menos coste de horas y de materiales. Las horas y los materiales se "
+             "convierten a la fecha de cada línea y las ventas a la fecha de la foto.")
+
+    _sql_constraints = [
+        ('project_date_unique', 'unique(project_id, date)', '¡Solo puede haber una foto por proyecto y día!')
+    ]
+
+    @api.model
+    def _cron_take_snapshots(self):
+        """
+        Tarea nocturna. Recalcula la foto del día solo para los proyectos con
+        cambios desde la última ejecución; el resto arrastra su última foto.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        started_at = fields.Datetime.now()
+        today = fields.Date.context_today(self)
+        last_run = params.get_param('project_stock_joyca.snapshot_last_run')
+
+        if last_run:
+            projects = self.env['project.project'].browse(self._get_changed_project_ids(last_run))
+        else:
+            projects = self.env['project.project'].search([])
+
+        if projects:
+            # Las cifras de venta/compra salen de la vista materializada: debe estar al día.
+            self.env['project.unified.line']._refresh_unified_lines(force=True)
+            self._write_snapshots(projects, today)
+        self._carry_forward_snapshots(projects, today)
+        self._clear_snapshot_dirty(projects)
+
+        params.set_param('project_stock_joyca.snapshot_last_run', fields.Datetime.to_string(started_at))
+
+    @api.model
+    def _get_changed_project_ids(self, since):
+        """
+        Proyectos con ventas, compras, partes de horas o materiales modificados
+        desde 'since', más los marcados como pendientes por los hooks de
+        invalidación del panel (borrados y cambios de proyecto, en el proyecto
+        antiguo y en el nuevo).
+        """
+        project_ids = set(self.env['project.project'].search(
+            ['|', ('write_date', '>=', since), ('x_snapshot_dirty', '=', True)]).ids)
+
+        for [project] in self.env['sale.order']._read_group(
+                [('write_date', '>=', since), ('project_id', '!=', False)], ['project_id']):
+            project_ids.add(project.id)
+        for [order] in self.env['sale.order.line']._read_group(
+                [('write_date', '>=', since), ('order_id.project_id', '!=', False)], ['order_id']):
+            project_ids.add(order.project_id.id)
+        for [order] in self.env['purchase.order.line']._read_group(
+                [('write_date', '>=', since), ('order_id.x_sale_order_id.project_id', '!=', False)], ['order_id']):
+            project_ids.add(order.x_sale_order_id.project_id.id)
+        for [project] in self.env['account.analytic.line']._read_group(
+                [('write_date', '>=', since), ('project_id', '!=', False)], ['project_id']):
+            project_ids.add(project.id)
+        for [project] in self.env['stock.move']._read_group(
+                [('write_date', '>=', since), ('x_project_id', '!=', False)], ['x_project_id']):
+            project_ids.add(project.id)
+
+        return list(project_ids)
+
+    @api.model
+    def _clear_snapshot_dirty(self, projects):
+        """ Quita la marca de pendiente a los proyectos ya fotografiados. """
+        if not projects:
+            return
+        self.env.cr.execute("""
+            UPDATE project_project SET x_snapshot_dirty = FALSE
+            WHERE id = ANY(%s) AND x_snapshot_dirty
+        """, [projects.ids])
+        projects.invalidate_recordset(['x_snapshot_dirty'])
+
+    @api.model
+    def _get_snapshot_values(self, projects):
+        """
+        Devuelve {id proyecto: {campo: importe}} en la moneda de cada proyecto.
+        Cada fuente se lee con una única consulta agrupada para todos los proyectos.
+        """
+        values = {project.id: dict.fromkeys(SNAPSHOT_AMOUNT_FIELDS, 0.0) for project in projects}
+        today = fields.Date.context_today(self)
+        rate_cache = {}
+
+        def add(project, field_name, amount, currency, date=None):
+            values[project.id][field_name] += currency._convert_cached(
+                amount, project.currency_id, project.company_id or self.env.company, date or today, rate_cache)
+
+        # 1. Ventas y coste de compra (coste proveedor de las líneas de venta): solo
+        #    pedidos confirmados, como en el panel (sin presupuestos, cancelados ni
+        #    versiones sustituidas)
+        for project, currency, revenue, invoiced, collected, purchase_cost in self.env['project.unified.line']._read_group(
+                [('project_id', 'in', projects.ids), ('sale_state', 'in', PANEL_SALE_STATES)],
+                ['project_id', 'currency_id'],
+                ['sale_amount:sum', 'sale_total_invoiced:sum', 'sale_paid_amount:sum', 'purchase_amount:sum']):
+            add(project, 'revenue', revenue, currency)
+            add(project, 'invoiced', invoiced, currency)
+            add(project, 'collected', collected, currency)
+            add(project, 'purchase_cost', purchase_cost, currency)
+
+        # Pagos de las compras enlazadas: se cuentan siempre, ya están pagados
+        for project, currency, paid in self.env['project.unified.line']._read_group(
+                [('project_id', 'in', projects.ids)],
+                ['project_id', 'currency_id'],
+                ['purchase_paid_amount:sum']):
+            add(project, 'paid', paid, currency)
+
+        # 2. Horas (a la fecha de cada parte, como en el panel)
+        for project, currency, date, cost in self.env['account.analytic.line']._read_group(
+                [('project_id', 'in', projects.ids), ('employee_id', '!=', False)],
+                ['project_id', 'currency_id', 'date:day'],
+                ['x_coste:sum']):
+            add(project, 'hours_cost', cost, currency, date)
+
+        # 3. Materiales (a la fecha de cada movimiento, como en el panel)
+        for project, currency, date, cost in self.env['stock.move']._read_group(
+                [('x_project_id', 'in', projects.ids), ('state', '=', 'done')],
+                ['x_project_id', 'currency_id', 'date:day'],
+                ['x_coste_total:sum']):
+            add(project, 'material_cost', cost, currency, date)
+
+        for project_values in values.values():
+            project_values['margin_amount'] = (
+                project_values['revenue'] - project_values['hours_cost'] - project_values['material_cost']
+            )
+        return values
+
+    @api.model
+    def _write_snapshots(self, projects, date):
+        """ Crea o actualiza la foto del día de los proyectos indicados. """
+        values = self._get_snapshot_values(projects)
+        existing = {
+            snapshot.project_id.id: snapshot
+            for snapshot in self.search([('project_id', 'in', projects.ids), ('date', '=', date)])
+        }
+        vals_list = []
+        for project in projects:
+            project_values = dict(values[project.id], currency_id=project.currency_id.id)
+            if project.id in existing:
+                existing[project.id].write(project_values)
+            else:
+                vals_list.append(dict(project_values, project_id=project.id, date=date))
+        self.create(vals_list)
+
+    @api.model
+    def _carry_forward_snapshots(self, changed_projects, date):
+        """
+        Copia al día 'date' la última foto de cada proyecto sin cambios, con un
+        único INSERT ... SELECT, para que haya una fila por proyecto y día.
+        """
+        self.env.flush_all()
+        columns = ['currency_id', 'margin_amount'] + SNAPSHOT_AMOUNT_FIELDS
+        self.env.cr.execute("""
+            INSERT INTO project_financial_snapshot
+                (project_id, date, {columns}, create_uid, create_date, write_uid, write_date)
+            SELECT DISTINCT ON (s.project_id)
+                s.project_id, %(date)s, {source_columns},
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM project_financial_snapshot s
+            WHERE s.date < %(date)s AND NOT (s.project_id = ANY(%(changed_ids)s))
+            ORDER BY s.project_id, s.date DESC
+            ON CONFLICT (project_id, date) DO NOTHING
+        """.format(
+            columns=', '.join(columns),
+            source_columns=', '.join('s.%s' % column for column in columns),
+        ), {'date': date, 'uid': self.env.uid, 'changed_ids': changed_projects.ids})
+        self.invalidate_model()
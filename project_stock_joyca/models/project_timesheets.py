@@ -1,5 +1,8 @@
 from odoo import models, fields, api
 
+# Campos de los partes de horas que lee el panel (ver Project._get_panel_timesheet_totals).
+PANEL_TIMESHEET_FIELDS = {'project_id', 'employee_id', 'date', 'currency_id', 'unit_amount', 'x_coste'}
+
 class AccountAnalyticLine(models.Model):
     _inherit = 'account.analytic.line'
 
@@ -27,4 +30,28 @@ class AccountAnalyticLine(models.Model):
                 # Esta es la fórmula que pediste:
                 line.x_coste = line.unit_amount * line.employee_id.hourly_cost
             else:
-                line.x_coste = 0.0
\ No newline at end of file
+                line.x_coste = 0.0
+        # El coste también cambia con el coste/hora del empleado, sin pasar por write
+        self.env['project.project']._invalidate_panel_cache(self._origin.project_id.ids)
+
+    # --- INVALIDACIÓN DE LA CACHÉ DEL PANEL DEL PROYECTO ---
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['project.project']._invalidate_panel_cache(lines.project_id.ids)
+        return lines
+
+    def write(self, vals):
+        if not PANEL_TIMESHEET_FIELDS & set(vals):
+            return super().write(vals)
+        project_ids = self.project_id.ids
+        res = super().write(vals)
+        self.env['project.project']._invalidate_panel_cache(project_ids + self.project_id.ids)
+        return res
+
+    def unlink(self):
+        project_ids = self.project_id.ids
+        res = super().unlink()
+        self.env['project.project']._invalidate_panel_cache(project_ids)
+        return res
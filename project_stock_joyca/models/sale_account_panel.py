@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api
+
+
+# Invalidación de la caché del panel del proyecto (ver Project.x_panel_cache)
+# cuando cambian los campos que lee el panel en sus pedidos de venta o en las
+# facturas de esos pedidos.
+
+# Campos del pedido que lee el panel (ver Project._get_panel_sale_orders).
+PANEL_SALE_ORDER_FIELDS = {'project_id', 'state', 'name', 'amount_untaxed', 'currency_id', 'date_order'}
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = super().create(vals_list)
+        self.env['project.project']._invalidate_panel_cache(orders.project_id.ids)
+        return orders
+
+    def write(self, vals):
+        if not PANEL_SALE_ORDER_FIELDS & set(vals):
+            return super().write(vals)
+        project_ids = self.project_id.ids
+        res = super().write(vals)
+        self.env['project.project']._invalidate_panel_cache(project_ids + self.project_id.ids)
+        return res
+
+    def unlink(self):
+        project_ids = self.project_id.ids
+        res = super().unlink()
+        self.env['project.project']._invalidate_panel_cache(project_ids)
+        return res
+
+    def _compute_amounts(self):
+        # Los importes se recalculan sin pasar por write (altas, cambios y bajas de líneas)
+        super()._compute_amounts()
+        self.env['project.project']._invalidate_panel_cache(self._origin.project_id.ids)
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    def write(self, vals):
+        # Los importes de las líneas llegan al panel por el pedido (_compute_amounts);
+        # aquí solo cambia el enlace con las facturas.
+        res = super().write(vals)
+        if 'invoice_lines' in vals:
+            self.env['project.project']._invalidate_panel_cache(self.order_id.project_id.ids)
+        return res
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Publicar, pasar a borrador o cancelar cambia el importe facturado del panel
+        if 'state' in vals:
+            invoices = self.filtered(lambda move: move.is_invoice(include_receipts=True))
+            self.env['project.project']._invalidate_panel_cache(
+                invoices.line_ids.sale_line_ids.order_id.project_id.ids)
+        return res
@@ -1,8 +1,36 @@
 from odoo import models, fields, api
+from odoo.tools.sql import column_exists, create_column
+
+# Campos de los movimientos que lee el panel (ver Project._get_panel_stock_moves).
+PANEL_STOCK_MOVE_FIELDS = {
+    'x_project_id', 'picking_id', 'state', 'product_id', 'product_qty', 'product_uom_qty',
+    'currency_id', 'date', 'x_coste_unitario', 'x_coste_total',
+}
 
 class StockMove(models.Model):
     _inherit = 'stock.move'
 
+    # Proyecto del albarán, guardado e indexado en el movimiento para contar y
+    # filtrar materiales por proyecto sin unir con stock_picking.
+    x_project_id = fields.Many2one(
+        related='picking_id.project_id',
+        string='Proyecto',
+        store=True,
+        index=True,
+    )
+
+    def _auto_init(self):
+        # Se rellena con una sola UPDATE en lugar de recalcular movimiento a movimiento.
+        if not column_exists(self.env.cr, 'stock_move', 'x_project_id'):
+            create_column(self.env.cr, 'stock_move', 'x_project_id', 'int4')
+            self.env.cr.execute("""
+                UPDATE stock_move sm
+                SET x_project_id = sp.project_id
+                FROM stock_picking sp
+                WHERE sm.picking_id = sp.id AND sp.project_id IS NOT NULL
+            """)
+        return super()._auto_init()
+
     # Campo helper para poder usar el widget 'monetary' en la vista
     currency_id = fields.Many2one(
         related='company_id.currency_id',
@@ -41,4 +69,48 @@ class StockMove(models.Model):
         por el coste unitario ya calculado.
         """
         for move in self:
-            move.x_coste_total = move.product_uom_qty * move.x_coste_unitario
\ No newline at end of file
+            move.x_coste_total = move.product_uom_qty * move.x_coste_unitario
+        # Coste recalculado sin pasar por write (cantidad o coste unitario)
+        self.env['project.project']._invalidate_panel_cache(self._origin.x_project_id.ids)
+
+    # --- INVALIDACIÓN DE LA CACHÉ DEL PANEL DEL PROYECTO ---
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        self.env['project.project']._invalidate_panel_cache(moves.x_project_id.ids)
+        return moves
+
+    def write(self, vals):
+        if not PANEL_STOCK_MOVE_FIELDS & set(vals):
+            return super().write(vals)
+        project_ids = self.x_project_id.ids
+        res = super().write(vals)
+        self.env['project.project']._invalidate_panel_cache(project_ids + self.x_project_id.ids)
+        return res
+
+    def unlink(self):
+        project_ids = self.x_project_id.ids
+        res = super().unlink()
+        self.env['project.project']._invalidate_panel_cache(project_ids)
+        return res
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    def write(self, vals):
+        # Al cambiar el proyecto del albarán se recalcula x_project_id de sus
+        # movimientos (campo relacionado), sin pasar por su write.
+        if 'project_id' not in vals:
+            return super().write(vals)
+        project_ids = self.project_id.ids
+        res = super().write(vals)
+        self.env['project.project']._invalidate_panel_cache(project_ids + self.project_id.ids)
+        return res
+
+    def unlink(self):
+        project_ids = self.project_id.ids
+        res = super().unlink()
+        self.env['project.project']._invalidate_panel_cache(project_ids)
+        return res
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from collections import defaultdict
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class StockMoveRevaluationJob(models.Model):
+    """
+    Revalorización del coste de materiales (x_coste_unitario / x_coste_total) de
+    los movimientos hechos con el coste estándar actual de cada producto.
+
+    La procesa un cron por bloques de movimientos: cada bloque es una única
+    UPDATE en SQL y se confirma la transacción tras cada bloque, de modo que si
+    el worker se reinicia el trabajo continúa desde el último bloque confirmado.
+    """
+    _name = 'stock.move.revaluation.job'
+    _description = 'Revalorización de Coste de Materiales'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='Referencia',
+        required=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: _('Nuevo'),
+    )
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('pending', 'Pendiente'),
+        ('running', 'En curso'),
+        ('done', 'Terminado'),
+        ('cancel', 'Cancelado'),
+    ], string='Estado', default='draft', required=True, readonly=True, index=True)
+
+    # --- FILTROS ---
+    date_from = fields.Date(string='Desde')
+    date_to = fields.Date(string='Hasta')
+    project_id = fields.Many2one('project.project', string='Proyecto')
+    categ_id = fields.Many2one('product.category', string='Categoría de Producto')
+
+    chunk_size = fields.Integer(
+        string='Tamaño de Bloque',
+        default=5000,
+        help="Número de movimientos revalorizados antes de confirmar la transacción."
+    )
+
+    # --- PROGRESO ---
+    total_count = fields.Integer(string='Total', readonly=True)
+    done_count = fields.Integer(string='Procesados', readonly=True)
+    progress = fields.Float(string='Progreso (%)', compute='_compute_progress')
+    last_move_id = fields.Integer(string='Último Movimiento Procesado', readonly=True)
+
+    date_start = fields.Datetime(string='Inicio', readonly=True)
+    date_end = fields.Datetime(string='Fin', readonly=True)
+    totals_before = fields.Json(string='Totales Antes', readonly=True, copy=False)
+    log = fields.Text(string='Registro', readonly=True)
+
+    @api.depends('total_count', 'done_count')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = job.total_count and (job.done_count / job.total_count) * 100 or 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', _('Nuevo')) == _('Nuevo'):
+                vals['name'] = fields.Datetime.to_string(fields.Datetime.now())
+        return super().create(vals_list)
+
+    def action_start(self):
+        """ Deja el trabajo en cola y lanza el cron. """
+        self.filtered(lambda job: job.state == 'draft').write({'state': 'pending'})
+        self.env.ref('project_stock_joyca.ir_cron_stock_move_revaluation_jobs')._trigger()
+        return True
+
+    def action_cancel(self):
+        """ Detiene el trabajo; los bloques ya revalorizados no se revierten. """
+        return self.filtered(lambda job: job.state in ('draft', 'pending', 'running')).write({'state': 'cancel'})
+
+    def _get_move_domain(self):
+        self.ensure_one()
+        domain = [('state', '=', 'done')]
+        if self.date_from:
+            domain.append(('date', '>=', self.date_from))
+        if self.date_to:
+            domain.append(('date', '<', fields.Date.add(self.date_to, days=1)))
+        if self.project_id:
+            domain.append(('x_project_id', '=', self.project_id.id))
+        if self.categ_id:
+            domain.append(('product_id.categ_id', 'child_of', self.categ_id.id))
+        return domain
+
+    def _get_project_totals(self):
+        """ {id proyecto: coste total de materiales} de los movimientos del trabajo. """
+        self.ensure_one()
+        return {
+            str(project.id): total
+            for project, total in self.env['stock.move']._read_group(
+                self._get_move_domain() + [('x_project_id', '!=', False)],
+                ['x_project_id'],
+                ['x_coste_total:sum'],
+            )
+        }
+
+    @api.model
+    def _cron_process_jobs(self, time_budget=300):
+        """
+        Procesa los trabajos pendientes o interrumpidos, en orden de creación,
+        durante como máximo `time_budget` segundos. Si queda trabajo, el cron se
+        vuelve a lanzar inmediatamente.
+        """
+        deadline = time.monotonic() + time_budget
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            if not job._process_chunks(deadline):
+                self.env.ref('project_stock_joyca.ir_cron_stock_move_revaluation_jobs')._trigger()
+                return
+
+    def _process_chunks(self, deadline):
+        """
+        Revaloriza los movimientos por bloques de `chunk_size` (en orden de id),
+        confirmando la transacción después de cada bloque.
+        Devuelve False si se agotó el tiempo antes de terminar.
+        """
+        self.ensure_one()
+        StockMove = self.env['stock.move']
+        if self.state == 'pending':
+            self.write({
+                'state': 'running',
+                'date_start': fields.Datetime.now(),
+                'total_count': StockMove.search_count(self._get_move_domain()),
+                'totals_before': self._get_project_totals(),
+            })
+            self.env.cr.commit()
+
+        while True:
+            # El trabajo puede haberse cancelado desde otra transacción.
+            self.invalidate_recordset(['state'])
+            if self.state == 'cancel':
+                return True
+            if time.monotonic() > deadline:
+                return False
+
+            moves = StockMove.search_fetch(
+                self._get_move_domain() + [('id', '>', self.last_move_id)],
+                ['product_id', 'company_id', 'x_project_id'],
+                limit=max(self.chunk_size, 1), order='id',
+            )
+            if not moves:
+                break
+
+            self._revalue_moves(moves)
+            self.write({
+                'last_move_id': moves[-1].id,
+                'done_count': self.done_count + len(moves),
+            })
+            self.env.cr.commit()
+            _logger.info(
+                "Revalorización %s: %s/%s movimientos procesados.",
+                self.name, self.done_count, self.total_count,
+            )
+
+        self.write({
+            'state': 'done',
+            'date_end': fields.Datetime.now(),
+            'log': self._format_totals_log(self.totals_before or {}, self._get_project_totals()),
+        })
+        self.env.cr.commit()
+        return True
+
+    def _revalue_moves(self, moves):
+        """
+        Aplica a los movimientos el coste estándar actual de su producto en su
+        compañía, con una única UPDATE sobre una tabla de precios (producto,
+        compañía, precio) construida para el bloque.
+        """
+        products_by_company = defaultdict(lambda: self.env['product.product'])
+        for move in moves:
+            products_by_company[move.company_id] |= move.product_id
+
+        product_ids, company_ids, prices = [], [], []
+        for company, products in products_by_company.items():
+            for product in products.with_company(company):
+                product_ids.append(product.id)
+                company_ids.append(company.id)
+                prices.append(product.standard_price)
+
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE stock_move sm
+            SET x_coste_unitario = price.standard_price,
+                x_coste_total = sm.product_uom_qty * price.standard_price,
+                write_date = NOW() AT TIME ZONE 'UTC'
+            FROM unnest(%s::int[], %s::int[], %s::numeric[]) AS price(product_id, company_id, standard_price)
+            WHERE sm.id = ANY(%s)
+              AND sm.product_id = price.product_id
+              AND sm.company_id = price.company_id
+        """, [product_ids, company_ids, prices, moves.ids])
+
+        # La UPDATE no pasa por el ORM: se vacían su caché y la del panel de los proyectos.
+        moves.invalidate_recordset(['x_coste_unitario', 'x_coste_total'])
+        self.env['project.project']._invalidate_panel_cache(moves.x_project_id.ids)
+
+    def _format_totals_log(self, totals_before, totals_after):
+        """ Una línea por proyecto con el coste de materiales antes y después. """
+        projects = self.env['project.project'].browse(
+            int(project_id) for project_id in set(totals_before) | set(totals_after)
+        ).exists()
+        lines = []
+        for project in projects.sorted('display_name'):
+            before = totals_before.get(str(project.id), 0.0)
+            after = totals_after.get(str(project.id), 0.0)
+            lines.append(f"{project.display_name}: {before:.2f} -> {after:.2f} ({after - before:+.2f})")
+            _logger.info("Revalorización %s - %s", self.name, lines[-1])
+        return '\n'.join(lines)
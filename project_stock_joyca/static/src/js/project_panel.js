@@ -0,0 +1,37 @@
+/** @odoo-module **/
+
+import { patch } from "@web/core/utils/patch";
+import { useState } from "@odoo/owl";
+import { ProjectRightSidePanel } from "@project/components/project_right_side_panel/project_right_side_panel";
+
+// Detalle de movimientos de materiales del panel, cargado por páginas bajo demanda.
+patch(ProjectRightSidePanel.prototype, {
+    setup() {
+        super.setup(...arguments);
+        this.stockMovesPage = useState({
+            open: false,
+            moves: [],
+            offset: 0,
+            limit: 20,
+            total: 0,
+        });
+    },
+
+    async loadStockMovesPage(offset) {
+        const page = await this.orm.call(
+            "project.project",
+            "get_panel_stock_moves_page",
+            [[this.props.projectId]],
+            { offset, limit: this.stockMovesPage.limit }
+        );
+        Object.assign(this.stockMovesPage, page, { open: true });
+    },
+
+    toggleStockMovesDetail() {
+        if (this.stockMovesPage.open) {
+            this.stockMovesPage.open = false;
+        } else {
+            this.loadStockMovesPage(0);
+        }
+    },
+});
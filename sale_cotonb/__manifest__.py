@@ -10,7 +10,7 @@
     'author': "Tu Nombre",
     'website': "https://www.tuweb.com",
     'category': 'Sales/Sales',
-    'version': '1.0',
+    'version': '1.1',
     'depends': [
         'sale_management',
         'project',
@@ -24,6 +24,8 @@
         'views/purshase_order.xml',
         'views/rename_project_wizard_views.xml',
         'views/sale_advance_payment_inv_view.xml',
+        'views/purchase_resync_job_views.xml',
+        'views/project_views.xml',
     ],
     'installable': True,
     'application': False,
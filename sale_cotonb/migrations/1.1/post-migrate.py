@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Rellena 'purchase_order.x_sale_order_id' para las compras ya existentes.
+    1. A partir de las líneas enlazadas con la venta ('x_source_sale_line_id').
+    2. Para las compras sin líneas enlazadas, emparejando el antiguo 'origin'
+       con el nombre de la venta.
+    """
+    cr.execute("""
+        UPDATE purchase_order po
+           SET x_sale_order_id = linked.sale_order_id
+          FROM (
+                SELECT DISTINCT ON (pol.order_id)
+                       pol.order_id AS purchase_order_id,
+                       sol.order_id AS sale_order_id
+                  FROM purchase_order_line pol
+                  JOIN sale_order_line sol ON sol.id = pol.x_source_sale_line_id
+              ORDER BY pol.order_id, pol.id
+               ) linked
+         WHERE linked.purchase_order_id = po.id
+           AND po.x_sale_order_id IS NULL
+    """)
+    _logger.info("x_sale_order_id rellenado desde las líneas enlazadas en %s compras.", cr.rowcount)
+
+    cr.execute("""
+        UPDATE purchase_order po
+           SET x_sale_order_id = so.id
+          FROM sale_order so
+         WHERE po.x_sale_order_id IS NULL
+           AND po.origin IS NOT NULL
+           AND so.name = po.origin
+    """)
+    _logger.info("x_sale_order_id rellenado desde el origen en %s compras.", cr.rowcount)
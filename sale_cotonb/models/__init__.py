@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from . import pricing_context
 from . import models
 from . import product_category
 from . import purchase_order
 from . import project_project
 from . import sale_advance_payment_inv
 from . import invoice_sale
-
+from . import purchase_resync_job
@@ -1,6 +1,6 @@
 from collections import defaultdict
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError, ValidationError
 import re
 
@@ -8,6 +8,46 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# Clave de la caché por transacción de los contadores de botones inteligentes.
+COUNTER_CACHE_KEY = 'sale_cotonb.order_counters'
+
+# Campos de la línea de venta que alteran la numeración jerárquica.
+LINE_NUMBERING_FIELDS = {'sequence', 'display_type', 'order_id'}
+
+# Clave en cr.precommit.data con los pedidos pendientes de renumerar
+# ({id de pedido: secuencia más baja modificada}).
+LINE_NUMBERING_PENDING_KEY = 'sale_cotonb.line_numbering_pending'
+
+# Marca de contexto: escritura por lotes (varias líneas en una operación);
+# la numeración se aplica una vez por pedido al terminar el lote.
+LINE_NUMBERING_BATCH = 'sale_line_numbering_batch'
+
+
+def number_order_lines(lines, start=0):
+    """
+    Genera (línea, etiqueta) con la numeración jerárquica "N" / "N.M".
+
+    `lines` son las líneas de un pedido ya ordenadas por secuencia y `start` es
+    0 o el índice de una sección: las líneas anteriores a `start` solo se usan
+    para saber cuántas secciones hay antes. Solo necesita el atributo
+    `display_type` de cada línea, por lo que puede medirse de forma aislada.
+    """
+    main_counter = sum(1 for line in lines[:start] if line.display_type == 'line_section')
+    sub_counter = 1
+    for line in lines[start:]:
+        # Si la línea es una SECCIÓN (ej: "Obra")
+        if line.display_type == 'line_section':
+            main_counter += 1
+            sub_counter = 1  # Reiniciamos el contador de sub-líneas
+            yield line, str(main_counter)
+        # Si es una línea de producto normal y ya hemos pasado por una sección
+        elif not line.display_type and main_counter > 0:
+            yield line, f"{main_counter}.{sub_counter}"
+            sub_counter += 1
+        # Para cualquier otro caso (notas, o líneas antes de la primera sección)
+        else:
+            yield line, ''
+
 
 class SaleOrderLine(models.Model):
     _inherit = 'sale.order.line'
@@ -39,6 +79,35 @@ class SaleOrderLine(models.Model):
             else:
                 line.coste_estimado = 0.0
 
+    # Agregados por línea que suman los totales de coste del pedido en SQL.
+    coste_estimado_subtotal = fields.Float(
+        string="Subtotal Coste Estimado",
+        compute='_compute_cost_subtotals',
+        store=True,
+        readonly=True,
+    )
+
+    provider_cost_subtotal = fields.Float(
+        string="Subtotal Coste Proveedor",
+        compute='_compute_cost_subtotals',
+        store=True,
+        readonly=True,
+    )
+
+    missing_provider_cost = fields.Boolean(
+        string="Sin Coste Proveedor",
+        compute='_compute_cost_subtotals',
+        store=True,
+        readonly=True,
+    )
+
+    @api.depends('coste_estimado', 'provider_cost', 'product_uom_qty')
+    def _compute_cost_subtotals(self):
+        for line in self:
+            line.coste_estimado_subtotal = line.coste_estimado * line.product_uom_qty
+            line.provider_cost_subtotal = line.provider_cost * line.product_uom_qty
+            line.missing_provider_cost = line.provider_cost == 0.0
+
     margen_estimado = fields.Float(
         string="Margen %",
         compute='_compute_margen_estimado',  # Asignamos la nueva función
@@ -47,10 +116,10 @@ class SaleOrderLine(models.Model):
         help="Calcula el margen basado en el coste real (si existe) o el coste estándar del producto."
     )
 
+    # Se mantiene de forma incremental desde create/write/unlink
+    # (ver SaleOrder._renumber_lines) en lugar de recalcular todo el pedido.
     line_number_display = fields.Char(
         string="N° Línea",
-        compute='_compute_line_number_display',
-        store=True,
         readonly=True
     )
 
@@ -76,29 +145,70 @@ class SaleOrderLine(models.Model):
             else:
                 line.percentage_invoiced_total = 0.0
 
-    @api.depends('order_id.order_line', 'order_id.order_line.display_type', 'order_id.order_line.sequence')
-    def _compute_line_number_display(self):
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._update_line_numbers(lines._get_line_numbering_starts())
+        return lines
+
+    def write(self, vals):
+        if not LINE_NUMBERING_FIELDS & set(vals):
+            return super().write(vals)
+        # Se renumera desde la posición más baja entre la antigua y la nueva.
+        starts = self._get_line_numbering_starts()
+        res = super().write(vals)
+        for order, sequence in self._get_line_numbering_starts().items():
+            starts[order] = min(starts.get(order, sequence), sequence)
+        self._update_line_numbers(starts)
+        return res
+
+    def unlink(self):
+        starts = self._get_line_numbering_starts()
+        res = super().unlink()
+        self._update_line_numbers(starts)
+        return res
+
+    def _get_line_numbering_starts(self):
+        """ Devuelve {pedido: secuencia más baja} de las líneas de self. """
+        starts = {}
+        for line in self:
+            order = line.order_id
+            starts[order] = min(starts.get(order, line.sequence), line.sequence)
+        return starts
+
+    @api.model
+    def _update_line_numbers(self, starts):
         """
-        Calcula y asigna la numeración jerárquica a las líneas de una orden de venta.
+        Anota los pedidos de `starts` para renumerarlos desde la secuencia
+        indicada. Fuera de un lote se renumera enseguida; dentro de un lote
+        (p. ej. reordenar K líneas arrastrándolas) cada pedido se renumera una
+        sola vez al terminar. El precommit aplica lo que quede pendiente.
         """
-        # Agrupamos las líneas por su orden de venta para procesarlas en bloque.
-        for order in self.mapped('order_id'):
-            main_counter = 0
-            sub_counter = 1
-            # Es crucial obtener las líneas ordenadas por su secuencia.
-            for line in order.order_line.sorted('sequence'):
-                # Si la línea es una SECCIÓN (ej: "Obra")
-                if line.display_type == 'line_section':
-                    main_counter += 1
-                    sub_counter = 1  # Reiniciamos el contador de sub-líneas
-                    line.line_number_display = str(main_counter)
-                # Si es una línea de producto normal y ya hemos pasado por una sección
-                elif line.display_type is False and main_counter > 0:
-                    line.line_number_display = f"{main_counter}.{sub_counter}"
-                    sub_counter += 1
-                # Para cualquier otro caso (notas, o líneas antes de la primera sección)
-                else:
-                    line.line_number_display = ''
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get(LINE_NUMBERING_PENDING_KEY)
+        if pending is None:
+            pending = precommit.data[LINE_NUMBERING_PENDING_KEY] = {}
+            precommit.add(self._flush_line_numbers)
+        for order, sequence in starts.items():
+            if order.id:
+                pending[order.id] = min(pending.get(order.id, sequence), sequence)
+        if not self.env.context.get(LINE_NUMBERING_BATCH):
+            self._flush_line_numbers()
+
+    @api.model
+    def _flush_line_numbers(self):
+        """ Renumera una vez cada pedido pendiente. """
+        pending = self.env.cr.precommit.data.get(LINE_NUMBERING_PENDING_KEY) or {}
+        while pending:
+            order_id, sequence = pending.popitem()
+            self.env['sale.order'].browse(order_id).exists()._renumber_lines(from_sequence=sequence)
+
+    def web_resequence(self, specification, field_name='sequence', offset=0):
+        # El cliente reordena las líneas con una escritura por línea
+        super(SaleOrderLine, self.with_context(**{LINE_NUMBERING_BATCH: True})).web_resequence(
+            {}, field_name=field_name, offset=offset)
+        self._flush_line_numbers()
+        return self.web_read(specification) if specification else []
 
     @api.depends('price_unit', 'provider_cost', 'coste_estimado')
     def _compute_margen_estimado(self):
@@ -124,41 +234,45 @@ class SaleOrderLine(models.Model):
                 # Si no hay coste, no podemos calcular el margen.
                 line.margen_estimado = 0.0
 
-    @api.depends('order_id.name', 'order_id.purchase_order_count', 'product_id')
+    @api.depends('order_id.x_purchase_order_ids', 'product_id')
     def _compute_provider_cost(self):
         """
         Calcula el coste de proveedor para CADA línea de venta.
-        Primero, encuentra las POs asociadas al pedido de venta.
-        Luego, dentro de esas POs, busca una línea de compra con el MISMO PRODUCTO.
+        Los costes de todas las líneas se resuelven de una sola vez con
+        _get_provider_cost_map(), en lugar de una búsqueda por pedido y por línea.
         """
-        # Buscamos los pedidos de venta de todas las líneas de una sola vez para optimizar
+        cost_map = self._get_provider_cost_map()
         for line in self:
-            line.provider_cost = 0.0
+            line.provider_cost = cost_map.get((line.order_id._origin.id, line.product_id.id), 0.0)
 
-        for order in self.mapped('order_id'):
-
-            purchase_orders = self.env['purchase.order'].search([
-                ('origin', '=', order.name)
-            ])
+    def _get_provider_cost_map(self):
+        """
+        Resuelve el coste de proveedor de todo el recordset con UNA única búsqueda.
 
-            # Si no hay órdenes de compra para este pedido, no hacemos nada más
-            if not purchase_orders:
-                continue
+        Devuelve un diccionario {(sale_order_id, product_id): price_unit} con las
+        líneas de compra de las POs enlazadas ('x_sale_order_id') a los pedidos de self.
 
-            # Ahora, para cada línea de este pedido de venta
-            for line in self.filtered(lambda l: l.order_id == order):
+        Regla de desempate: si varias líneas de compra comparten venta y producto,
+        gana la primera según el orden por defecto de 'purchase.order.line'
+        (order_id, sequence, id), que es la misma que devolvía el antiguo
+        search(limit=1) por línea.
+        """
+        sale_orders = self.order_id._origin
+        products = self.product_id._origin
+        if not sale_orders or not products:
+            return {}
 
-                # Buscamos dentro de las POs encontradas una línea con el mismo producto
-                # Esto es más robusto que depender de un campo de enlace directo
-                purchase_line = self.env['purchase.order.line'].search([
-                    ('order_id', 'in', purchase_orders.ids),
-                    ('product_id', '=', line.product_id.id),
-                ], limit=1)  # Tomamos la primera que encontremos
+        purchase_lines = self.env['purchase.order.line'].search_fetch([
+            ('order_id.x_sale_order_id', 'in', sale_orders.ids),
+            ('product_id', 'in', products.ids),
+        ], ['order_id', 'product_id', 'price_unit'])
 
-                if purchase_line:
-                    # ¡CORREGIDO! Asignamos el valor numérico (float) directamente.
-                    # Ya no formateamos el texto aquí.
-                    line.provider_cost = purchase_line.price_unit
+        cost_map = {}
+        for purchase_line in purchase_lines:
+            key = (purchase_line.order_id.x_sale_order_id.id, purchase_line.product_id.id)
+            # Respetamos el orden de la búsqueda: la primera línea encontrada gana.
+            cost_map.setdefault(key, purchase_line.price_unit)
+        return cost_map
 
 
 class SaleOrder(models.Model):
@@ -173,6 +287,13 @@ class SaleOrder(models.Model):
         ('confirmed', 'Confirmado'),
     ], string='Estado Personalizado', default='draft', readonly=True, copy=False, tracking=True)
 
+    x_purchase_order_ids = fields.One2many(
+        'purchase.order',
+        'x_sale_order_id',
+        string="Compras Generadas",
+        readonly=True,
+    )
+
     purchase_order_count = fields.Integer(
         string="Órdenes de Compra",
         compute='_compute_purchase_order_count',
@@ -185,6 +306,31 @@ class SaleOrder(models.Model):
         readonly=True
     )
 
+    # Totales de coste del pedido: se suman en SQL a partir de los subtotales
+    # de las líneas, sin cargar las líneas en memoria. No se mantienen por
+    # diferencias porque los subtotales también cambian por recálculos (coste
+    # de las compras, precio estándar) que no pasan por write.
+    total_coste_estimado = fields.Float(
+        string="Coste Estimado Total",
+        compute='_compute_cost_totals',
+        store=True,
+        readonly=True,
+    )
+
+    total_provider_cost = fields.Float(
+        string="Coste Proveedor Total",
+        compute='_compute_cost_totals',
+        store=True,
+        readonly=True,
+    )
+
+    missing_provider_cost_count = fields.Integer(
+        string="Líneas sin Coste Proveedor",
+        compute='_compute_cost_totals',
+        store=True,
+        readonly=True,
+    )
+
     total_margin = fields.Float(
         string="Margen Total %",  # El string base ya no es tan importante
         compute='_compute_total_margin',
@@ -204,30 +350,72 @@ class SaleOrder(models.Model):
         compute='_compute_has_purchasable_products'
     )
 
+    def write(self, vals):
+        if 'order_line' in vals:
+            # Los comandos de líneas se aplican con una escritura por línea:
+            # se numera una sola vez por pedido al terminar.
+            res = super(SaleOrder, self.with_context(**{LINE_NUMBERING_BATCH: True})).write(vals)
+            self.env['sale.order.line']._flush_line_numbers()
+        else:
+            res = super().write(vals)
+        if 'name' in vals:
+            # Los proyectos se cuentan por el nombre de la venta
+            self._invalidate_counter_cache('project_count')
+            self._invalidate_counter_cache('purchase_order_count')
+        return res
+
     @api.depends('order_line.product_id.purchase_ok')
     def _compute_has_purchasable_products(self):
         # El 'self' aquí es un registro de sale.order, que SÍ tiene 'order_line'
         for order in self:
             order.has_purchasable_products = any(line.product_id.purchase_ok for line in order.order_line)
 
-    @api.depends('order_line.provider_cost', 'order_line.coste_estimado', 'amount_untaxed')
-    def _compute_total_margin(self):
+    @api.depends('order_line.coste_estimado_subtotal', 'order_line.provider_cost_subtotal',
+                 'order_line.missing_provider_cost')
+    def _compute_cost_totals(self):
+        """
+        Suma los subtotales de coste de las líneas con un único _read_group.
+        Los pedidos aún no guardados (onchange) se calculan en memoria.
+        """
+        stored_orders = self.filtered('id')
+        totals = defaultdict(lambda: [0.0, 0.0, 0])
+        if stored_orders:
+            groups = self.env['sale.order.line']._read_group(
+                [('order_id', 'in', stored_orders.ids)],
+                ['order_id', 'missing_provider_cost'],
+                ['coste_estimado_subtotal:sum', 'provider_cost_subtotal:sum', '__count'],
+            )
+            for order, missing, estimated, real, count in groups:
+                order_totals = totals[order.id]
+                order_totals[0] += estimated
+                order_totals[1] += real
+                if missing:
+                    order_totals[2] += count
+        for order in self - stored_orders:
+            totals[order.id] = [
+                sum(order.order_line.mapped('coste_estimado_subtotal')),
+                sum(order.order_line.mapped('provider_cost_subtotal')),
+                len(order.order_line.filtered('missing_provider_cost')),
+            ]
         for order in self:
-            if not order.order_line:
-                order.total_margin = 0.0
-                order.total_margin_label = _("Margen Total %")  # Etiqueta por defecto
-                continue
-
-            use_estimated_cost = any(line.provider_cost == 0.0 for line in order.order_line)
+            estimated, real, missing_count = totals[order.id]
+            order.total_coste_estimado = estimated
+            order.total_provider_cost = real
+            order.missing_provider_cost_count = missing_count
 
-            if use_estimated_cost:
+    @api.depends('total_coste_estimado', 'total_provider_cost', 'missing_provider_cost_count', 'amount_untaxed')
+    def _compute_total_margin(self):
+        for order in self:
+            # Un pedido sin líneas no tiene costes: margen 0 con la etiqueta por defecto.
+            # Basta una línea sin coste de proveedor para usar el coste estimado.
+            if order.missing_provider_cost_count:
                 # 2. Asignamos la etiqueta para el margen estimado
                 order.total_margin_label = _("Margen Estimado %")
-                total_cost = sum(line.coste_estimado * line.product_uom_qty for line in order.order_line)
+                total_cost = order.total_coste_estimado
             else:
                 # 3. Asignamos la etiqueta para el margen real
                 order.total_margin_label = _("Margen Total %")
-                total_cost = sum(line.provider_cost * line.product_uom_qty for line in order.order_line)
+                total_cost = order.total_provider_cost
 
             if total_cost > 0:
                 profit = order.amount_untaxed - total_cost
@@ -237,11 +425,22 @@ class SaleOrder(models.Model):
                 order.total_margin = 0.0
 
     def _compute_project_count(self):
-        for order in self:
-            # Busca en 'project.project' en lugar de 'purchase.order'
-            order.project_count = self.env['project.project'].search_count(
-                [('name', '=', order.name)]
+        """
+        Cuenta los proyectos con el mismo nombre que la venta, para todo el
+        recordset con una única consulta agrupada.
+        """
+        cache = self._get_counter_cache('project_count')
+        missing = self._origin.filtered(lambda o: o.id not in cache)
+        if missing:
+            groups = self.env['project.project']._read_group(
+                [('name', 'in', missing.mapped('name'))], ['name'], ['__count'],
             )
+            counts = dict(groups)
+            for order in missing:
+                cache[order.id] = counts.get(order.name, 0)
+
+        for order in self:
+            order.project_count = cache.get(order._origin.id, 0)
 
     def action_view_projects(self):
         self.ensure_one()
@@ -256,15 +455,78 @@ class SaleOrder(models.Model):
 
     def _compute_purchase_order_count(self):
         """
-        Calcula el número de órdenes de compra creadas a partir de esta venta.
+        Calcula el número de órdenes de compra creadas a partir de cada venta,
+        para todo el recordset con una única consulta agrupada sobre el enlace
+        indexado 'x_sale_order_id'.
         """
-        for order in self:
-            # Usamos search_count para una mayor eficiencia.
-            # Busca en 'purchase.order' todos los registros cuyo campo 'origin'
-            # sea igual al nombre (referencia) de este pedido de venta.
-            order.purchase_order_count = self.env['purchase.order'].search_count(
-                [('origin', '=', order.name)]
+        cache = self._get_counter_cache('purchase_order_count')
+        missing = self._origin.filtered(lambda o: o.id not in cache)
+        if missing:
+            groups = self.env['purchase.order']._read_group(
+                [('x_sale_order_id', 'in', missing.ids)], ['x_sale_order_id'], ['__count'],
             )
+            counts = {sale_order.id: count for sale_order, count in groups}
+            for order in missing:
+                cache[order.id] = counts.get(order.id, 0)
+
+        for order in self:
+            order.purchase_order_count = cache.get(order._origin.id, 0)
+
+    def _renumber_lines(self, from_sequence=None):
+        """
+        Calcula y asigna la numeración jerárquica a las líneas de una orden de venta.
+
+        Con `from_sequence` solo se recorre la sección que contiene esa secuencia
+        y las líneas posteriores; sin él se renumera el pedido completo. En ambos
+        casos solo se escriben las líneas cuya etiqueta cambia realmente.
+        """
+        for order in self:
+            # Ordenamos por secuencia (y por id en caso de empate).
+            lines = order.order_line.sorted(lambda l: (l.sequence, l.id))
+
+            start = 0
+            if from_sequence is not None:
+                # Retrocedemos hasta la cabecera de la sección donde ocurrió el cambio.
+                for index, line in enumerate(lines):
+                    if line.sequence >= from_sequence:
+                        break
+                    if line.display_type == 'line_section':
+                        start = index
+
+            lines_by_label = defaultdict(list)
+            for line, label in number_order_lines(lines, start):
+                if (line.line_number_display or '') != label:
+                    lines_by_label[label].append(line.id)
+
+            for label, line_ids in lines_by_label.items():
+                self.env['sale.order.line'].browse(line_ids).write({'line_number_display': label})
+
+    def _get_counter_cache(self, counter):
+        """
+        Devuelve la caché {sale_order_id: valor} del contador indicado.
+
+        La caché vive en los datos de la transacción (cr.precommit.data), así que
+        se descarta al confirmar o deshacer la transacción; además se vacía al
+        crear, modificar o eliminar compras o proyectos y al renombrar ventas (ver
+        _invalidate_counter_cache). Los recuentos dependen de las reglas de
+        registro, por lo que se guardan por usuario y compañías activas. Con el
+        contexto 'skip_counter_cache' se devuelve un diccionario vacío y el
+        contador se calcula siempre.
+        """
+        if self.env.context.get('skip_counter_cache'):
+            return {}
+        counters = self.env.cr.precommit.data.setdefault(COUNTER_CACHE_KEY, {})
+        key = (counter, self.env.uid, tuple(self.env.companies.ids))
+        return counters.setdefault(key, {})
+
+    @api.model
+    def _invalidate_counter_cache(self, counter):
+        """ Descarta los valores en caché del contador indicado, para todos los usuarios. """
+        counters = self.env.cr.precommit.data.get(COUNTER_CACHE_KEY)
+        if not counters:
+            return
+        for key in [key for key in counters if key[0] == counter]:
+            del counters[key]
 
     def action_view_purchase_orders(self):
         """
@@ -278,7 +540,7 @@ class SaleOrder(models.Model):
             'name': _('Órdenes de Compra'),
             'res_model': 'purchase.order',
             'view_mode': 'list,form',
-            'domain': [('origin', '=', self.name)],  # Filtra para mostrar solo las PO de esta SO
+            'domain': [('x_sale_order_id', '=', self.id)],  # Filtra para mostrar solo las PO de esta SO
             'target': 'current',
         }
 
@@ -316,100 +578,115 @@ class SaleOrder(models.Model):
     #         self.write({'custom_state': 'sent'})
     #     return super(SaleOrder, self.with_context(mail_post_autofollow=True)).message_post(**kwargs)
 
-    def action_confirm(self):
+    def _check_provider_costs(self):
         """
-        Heredamos la acción de confirmar.
-        1. Se ejecuta la lógica original de Odoo.
-        2. Se actualiza nuestro estado personalizado.
-        3. Se crea un proyecto para la venta.
-        4. Se crea una tarea en ese proyecto por cada línea del presupuesto,
-        EXCLUYENDO las que son gastos refacturados.
+        Valida en una única búsqueda que ningún pedido tenga productos de compra
+        sin coste de proveedor (salvo los honorarios).
         """
-        products_without_cost = []
-
-        # Recorremos cada línea del presupuesto de venta (self.order_line)
-        for line in self.order_line:
-            # Condición 1: El producto se puede comprar (es un producto de compra)
-            # Condición 2: El coste del proveedor es 0 (no se ha asignado)
-            # Condición 3: El producto NO es el de honorarios (excepción)
-            if line.product_id.purchase_ok and line.provider_cost == 0 and line.product_id.default_code != 'honorario':
-                # Si se cumplen las tres condiciones, añadimos el nombre del producto a la lista.
-                products_without_cost.append(line.product_id.name)
-
-        # Si la lista NO está vacía, significa que encontramos productos que bloquean la confirmación.
-        if products_without_cost:
-            # Creamos un mensaje de error claro para el usuario.
+        lines = self.env['sale.order.line'].search_fetch([
+            ('order_id', 'in', self.ids),
+            ('product_id.purchase_ok', '=', True),
+            ('provider_cost', '=', 0),
+            ('product_id.default_code', '!=', 'honorario'),
+        ], ['order_id', 'product_id'])
+        if not lines:
+            return
+
+        products_by_order = defaultdict(list)
+        for line in lines:
+            products_by_order[line.order_id].append(line.product_id.name)
+
+        if len(products_by_order) == 1:
+            products_without_cost = next(iter(products_by_order.values()))
             error_message = (
                 "No se puede confirmar el pedido. \n\n"
                 "Los siguientes productos son de compra y no tienen un coste de proveedor asignado:\n"
                 f"- {', '.join(products_without_cost)}\n\n"
                 "Por favor, actualiza los precios desde los presupuestos de compra o asigna un proveedor en la ficha del producto."
             )
-            # Lanzamos una excepción ValidationError que mostrará el mensaje en un diálogo.
-            raise ValidationError(error_message)
+        else:
+            details = "\n".join(
+                f"- {order.name}: {', '.join(products)}" for order, products in products_by_order.items()
+            )
+            error_message = (
+                "No se pueden confirmar los pedidos. \n\n"
+                "Los siguientes pedidos tienen productos de compra sin coste de proveedor asignado:\n"
+                f"{details}\n\n"
+                "Por favor, actualiza los precios desde los presupuestos de compra o asigna un proveedor en la ficha del producto."
+            )
+        raise ValidationError(error_message)
+
+    def action_confirm(self):
+        """
+        Heredamos la acción de confirmar.
+        1. Se validan los costes de proveedor de todos los pedidos a la vez.
+        2. Se ejecuta la lógica original de Odoo y se actualiza nuestro estado personalizado.
+        3. Los proyectos sin código quedan en la cola de proyectos pendientes de nombre.
+        4. Si se confirma un único pedido, se abre el asistente para nombrar sus proyectos;
+        en modo lote (varios pedidos o contexto 'sale_batch_confirm') no se abre ningún
+        diálogo y los proyectos se nombran después desde la cola.
+        """
+        self._check_provider_costs()
 
         res = super(SaleOrder, self).action_confirm()
 
         self.write({'custom_state': 'confirmed'})
-        project = self.order_line.mapped('project_id')
-        if project:
-            # 3. Si se encontró un proyecto, abrimos nuestro asistente
-            return {
-                'name': _('Asignar Nombre al Proyecto'),
-                'type': 'ir.actions.act_window',
-                'res_model': 'rename.project.wizard',
-                'view_mode': 'form',
-                'target': 'new',  # Para que se abra como una ventana emergente
-                'context': {
-                    # Le pasamos los datos al asistente
-                    'default_project_id': project[0].id,
-                    'default_name': project[0].name,
-                }
-            }
+        projects = self.order_line.project_id.filtered(lambda project: not project.project_code)
+        if not projects:
+            return res
 
-        return res
+        projects.write({'x_pending_naming': True})
+        if len(self) > 1 or self.env.context.get('sale_batch_confirm'):
+            return res
+
+        # 3. Abrimos nuestro asistente para cada proyecto del pedido, uno tras otro
+        return self.env['project.project'].with_context(
+            rename_project_queue_ids=projects.ids,
+        ).action_open_next_pending_naming()
 
     def action_create_purchase_order(self):
         """
-        Crea UNA ÚNICA orden de compra con todos los productos comprables de la venta.
+        Crea UNA ÚNICA orden de compra por venta con todos sus productos comprables.
         1. Busca un proveedor por defecto.
-        2. Recopila todas las líneas de venta con productos que se pueden comprar.
-        3. Crea una sola orden de compra para ese proveedor con todas las líneas recopiladas.
+        2. Recopila, para cada venta, las líneas con productos que se pueden comprar.
+        3. Crea una sola orden de compra por venta para ese proveedor con las líneas recopiladas.
         """
-        self.ensure_one()
-
         # 1. Buscar al proveedor por defecto llamado "Proveedor Reserva"
-        default_supplier = self.env['res.partner'].search([('name', '=', 'Proveedor Reserva')], limit=1)
-        if not default_supplier:
-            raise UserError(
-                _("No se pudo encontrar el proveedor por defecto 'Proveedor Reserva'. Por favor, créelo o verifique el nombre."))
-
-        # 2. Filtrar y recopilar todas las líneas con productos que se puedan comprar en una sola lista
-        purchasable_lines = self.order_line.filtered(lambda l: l.product_id and l.product_id.purchase_ok)
-
-        if not purchasable_lines:
-            raise UserError(_("No hay productos comprables en este presupuesto para generar una orden de compra."))
-
-        # 3. Preparar los valores para crear UNA ÚNICA orden de compra
-        po_vals = {
-            'partner_id': default_supplier.id,
-            'origin': self.name,
-            'note': _('Orden de compra generada desde la venta %s', self.name),  # Nota más genérica
-            'order_line': [
-                (0, 0, {
-                    'product_id': sol.product_id.id,
-                    'product_qty': sol.product_uom_qty,
-                    # 'product_uom': sol.product_id.uom_po_id.id,
-                    'price_unit': sol.product_id.standard_price,
-                    'date_planned': fields.Datetime.now(),
-                    'name': sol.product_id.display_name,
-                    'x_source_sale_line_id': sol.id,  # Se mantiene la referencia a la línea de venta
-                }) for sol in purchasable_lines
-            ]
-        }
+        pricing = self.env['sale.pricing.context']
+        default_supplier = pricing.get_default_supplier()
+
+        # Costes de todos los productos comprables en una sola lectura
+        pricing._get_product_costs(self.order_line.product_id.filtered('purchase_ok'))
+
+        po_vals_list = []
+        for order in self:
+            # 2. Filtrar y recopilar todas las líneas con productos que se puedan comprar en una sola lista
+            purchasable_lines = order.order_line.filtered(lambda l: l.product_id and l.product_id.purchase_ok)
+
+            if not purchasable_lines:
+                raise UserError(_("No hay productos comprables en el presupuesto %s para generar una orden de compra.", order.name))
+
+            # 3. Preparar los valores para crear UNA ÚNICA orden de compra
+            po_vals_list.append({
+                'partner_id': default_supplier.id,
+                'origin': order.name,
+                'x_sale_order_id': order.id,
+                'note': _('Orden de compra generada desde la venta %s', order.name),  # Nota más genérica
+                'order_line': [
+                    (0, 0, {
+                        'product_id': sol.product_id.id,
+                        'product_qty': sol.product_uom_qty,
+                        # 'product_uom': sol.product_id.uom_po_id.id,
+                        'price_unit': pricing.get_product_cost(sol.product_id),
+                        'date_planned': fields.Datetime.now(),
+                        'name': sol.product_id.display_name,
+                        'x_source_sale_line_id': sol.id,  # Se mantiene la referencia a la línea de venta
+                    }) for sol in purchasable_lines
+                ]
+            })
 
-        # Crear la orden de compra
-        self.env['purchase.order'].create(po_vals)
+        # Crear las órdenes de compra
+        self.env['purchase.order'].create(po_vals_list)
         self.action_update_purchase_orders()
 
         # 4. Devolver una notificación de éxito
@@ -430,7 +707,7 @@ class SaleOrder(models.Model):
             if order.custom_state != 'waiting_purchase':
                 continue
 
-            purchase_orders = self.env['purchase.order'].search([('origin', '=', order.name)])
+            purchase_orders = order.x_purchase_order_ids
 
             if not purchase_orders:
                 continue
@@ -442,48 +719,96 @@ class SaleOrder(models.Model):
                 # Si es así, cambia el estado de la SO.
                 order.action_ready_to_ship()
 
-    def action_update_purchase_orders(self):
+    def action_update_purchase_orders(self, dry_run=False):
         """
-        Sincroniza UNA ÚNICA orden de compra con las líneas de la venta.
-        1. Busca o crea una única orden de compra para un proveedor por defecto.
-        2. Sincroniza las líneas:
+        Sincroniza la orden de compra única de cada venta con sus líneas.
+        1. Calcula el plan completo de cambios (_prepare_purchase_sync_plan):
            - Elimina productos en la compra que ya no están en la venta.
            - Añade productos a la compra que son nuevos en la venta.
            - Actualiza las cantidades si han cambiado entre la venta y la compra.
-        3. Actualiza los precios en las líneas de venta basándose en los costes
-           de la orden de compra.
+           - Actualiza los precios en las líneas de venta basándose en los costes
+             de la orden de compra.
+        2. Aplica el plan de una vez (_apply_purchase_sync_plan).
+
+        Con dry_run=True no se escribe nada y se devuelve {sale_order_id: plan}.
+        Para muchas ventas, ver action_resync_purchase_orders_background.
         """
-        self.ensure_one()
+        plans = {}
+        for order in self:
+            _logger.info(f"Iniciando sincronización de compra única para la venta: {order.name}")
+            plans[order.id] = order._prepare_purchase_sync_plan()
+        if dry_run:
+            return plans
+
+        for order in self:
+            order._apply_purchase_sync_plan(plans[order.id])
+
+        # La notificación de éxito y refresco se mantiene igual
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Proceso Completado'),
+                'message': _('La orden de compra y los precios han sido actualizados.'),
+                'type': 'success',
+                'sticky': False,
+                'next': {
+                    'type': 'ir.actions.act_window_close'
+                }
+            }
+        }
 
-        _logger.info(f"Iniciando sincronización de compra única para la venta: {self.name}")
+    def action_resync_purchase_orders_background(self):
+        """
+        Encola la resincronización de compras de las ventas seleccionadas en un
+        trabajo en segundo plano (ver 'sale.purchase.resync.job').
+        """
+        job = self.env['sale.purchase.resync.job'].create({
+            'order_ids': [Command.set(self.ids)],
+            'pending_order_ids': [Command.set(self.ids)],
+        })
+        self.env.ref('sale_cotonb.ir_cron_purchase_resync_jobs')._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Resincronización en cola'),
+                'message': _('Se resincronizarán %s ventas en segundo plano (%s).', len(self), job.name),
+                'type': 'info',
+                'sticky': False,
+            }
+        }
 
-        # --- 1. LOCALIZAR O CREAR LA ORDEN DE COMPRA ÚNICA ---
+    def _prepare_purchase_sync_plan(self):
+        """
+        Calcula, sin escribir nada, todos los cambios necesarios para sincronizar
+        la compra de esta venta. Devuelve un diccionario con:
+        - purchase_order_id: PO existente (False si hay que crearla).
+        - partner_id: proveedor por defecto, para crear la PO si no existe.
+        - lines_to_unlink: ids de líneas de compra a eliminar.
+        - lines_to_create: valores de las nuevas líneas de compra.
+        - quantity_updates: {cantidad: [ids de líneas de compra]}.
+        - unlink_purchase_order: True si la PO se queda sin líneas.
+        - sale_line_updates: {campo: {valor: [ids de líneas de venta]}}, vista previa
+          con los precios actuales de la compra (ver _apply_purchase_sync_plan).
+        """
+        self.ensure_one()
+
+        # --- 1. LOCALIZAR LA ORDEN DE COMPRA ÚNICA ---
 
         # Se busca el proveedor por defecto. Si no existe, no se puede continuar.
-        supplier = self.env['res.partner'].search([('name', '=', 'Proveedor Reserva')], limit=1)
-        if not supplier:
-            raise UserError(_("No se pudo encontrar el proveedor por defecto 'Proveedor Reserva'."))
+        pricing = self.env['sale.pricing.context']
+        supplier = pricing.get_default_supplier()
 
-        # Busca una PO existente para esta venta y este proveedor.
-        purchase_order = self.env['purchase.order'].search([
-            ('origin', '=', self.name),
-            # ('partner_id', '=', supplier.id)
-        ], limit=1)
+        # Busca una PO existente para esta venta.
+        purchase_order = self.x_purchase_order_ids[:1]
 
-        # Si no existe, la crea vacía. Las líneas se añadirán después.
-        if not purchase_order:
-            purchase_order = self.env['purchase.order'].create({
-                'partner_id': supplier.id,
-                'origin': self.name,
-                'notes': _('Orden de compra generada desde la venta %s', self.name),
-            })
-            _logger.info(f"Creada nueva orden de compra única: {purchase_order.name}")
+        # --- 2. DIFERENCIAS DE LÍNEAS (ELIMINAR, AÑADIR, ACTUALIZAR) ---
 
-        # --- 2. SINCRONIZAR LÍNEAS (ELIMINAR, AÑADIR, ACTUALIZAR) ---
-
-        # Mapeo de productos y cantidades de la VENTA (SO)
+        # Mapeo de productos de la VENTA (SO): la última línea de cada producto
+        # fija la cantidad, como hasta ahora.
         so_lines_map = {
-            line.product_id: line.product_uom_qty for line in self.order_line
+            line.product_id: line for line in self.order_line
             if line.product_id and line.product_id.purchase_ok
         }
 
@@ -491,95 +816,146 @@ class SaleOrder(models.Model):
         po_lines_map = {line.product_id: line for line in purchase_order.order_line}
 
         # Productos a eliminar: están en la PO pero ya no en la SO
-        products_to_remove = set(po_lines_map.keys()) - set(so_lines_map.keys())
-        if products_to_remove:
-            lines_to_unlink = self.env['purchase.order.line']
-            for product in products_to_remove:
-                po_line = po_lines_map[product]
-                if po_line.order_id.state in ('purchase', 'done'):
-                    raise UserError(
-                        _("No se puede eliminar la línea del producto '%s' porque la orden de compra %s ya ha sido confirmada.") %
-                        (po_line.product_id.display_name, po_line.order_id.name)
-                    )
-                lines_to_unlink += po_line
-
-            if lines_to_unlink:
-                lines_to_unlink.unlink()
-                _logger.info(f"Se eliminaron {len(lines_to_unlink)} líneas de la compra {purchase_order.name}")
+        lines_to_unlink = self.env['purchase.order.line']
+        for product in po_lines_map.keys() - so_lines_map.keys():
+            po_line = po_lines_map[product]
+            if po_line.order_id.state in ('purchase', 'done'):
+                raise UserError(
+                    _("No se puede eliminar la línea del producto '%s' porque la orden de compra %s ya ha sido confirmada.") %
+                    (po_line.product_id.display_name, po_line.order_id.name)
+                )
+            lines_to_unlink += po_line
 
         # Productos a añadir o actualizar
-        po_lines_vals_to_create = []
-        for product, qty in so_lines_map.items():
+        quantity_updates = defaultdict(list)
+        lines_to_create = []
+        # Coste final de cada producto en la PO, en el orden de sus líneas.
+        final_costs = [
+            (po_line.product_id, po_line.price_unit)
+            for po_line in purchase_order.order_line - lines_to_unlink
+        ]
+        # Costes de los productos nuevos en una sola lectura
+        pricing._get_product_costs(self.env['product.product'].union(
+            *(so_lines_map.keys() - po_lines_map.keys())))
+        for product, sale_line in so_lines_map.items():
+            qty = sale_line.product_uom_qty
             if product in po_lines_map:
                 # El producto ya existe: ACTUALIZAR CANTIDAD si es diferente
-                po_line = po_lines_map[product]
-                if po_line.product_qty != qty:
-                    po_line.write({'product_qty': qty})
-                    _logger.info(f"Cantidad actualizada para '{product.display_name}' a {qty} en {purchase_order.name}")
+                if po_lines_map[product].product_qty != qty:
+                    quantity_updates[qty].append(po_lines_map[product].id)
             else:
                 # El producto es nuevo: AÑADIR a la lista para creación masiva
-                po_lines_vals_to_create.append({
-                    'order_id': purchase_order.id,
+                cost = pricing.get_product_cost(product)  # Costo estándar como precio inicial
+                lines_to_create.append({
                     'product_id': product.id,
                     'product_qty': qty,
-                    # 'product_uom': product.uom_po_id.id,
-                    'price_unit': product.standard_price,  # Costo estándar como precio inicial
-                    'date_planned': fields.Datetime.now(),
+                    'price_unit': cost,
                     'name': product.display_name,
+                    'x_source_sale_line_id': sale_line.id,
                 })
+                final_costs.append((product, cost))
 
-        if po_lines_vals_to_create:
-            self.env['purchase.order.line'].create(po_lines_vals_to_create)
-            _logger.info(f"Se añadieron {len(po_lines_vals_to_create)} nuevas líneas a la compra {purchase_order.name}")
+        # Si la PO se quedara sin líneas después de la sincronización, se elimina.
+        unlink_purchase_order = bool(purchase_order) and not final_costs
 
-        # Si la PO se quedó sin líneas después de la sincronización, se cancela y elimina.
-        if not purchase_order.order_line:
-            purchase_order.button_cancel()
-            purchase_order.unlink()
-            _logger.info(f"Se eliminó la orden de compra vacía {purchase_order.name}")
+        # --- 3. PRECIOS EN LA VENTA ---
+
+        # Vista previa con los precios actuales de la compra; al aplicar el plan se
+        # recalculan con los precios tras escribir las cantidades.
+        sale_line_updates = {} if unlink_purchase_order else self._prepare_purchase_sync_sale_updates(final_costs)
+
+        return {
+            'purchase_order_id': purchase_order.id,
+            'partner_id': supplier.id,
+            'lines_to_unlink': lines_to_unlink.ids,
+            'lines_to_create': lines_to_create,
+            'quantity_updates': dict(quantity_updates),
+            'unlink_purchase_order': unlink_purchase_order,
+            'sale_line_updates': sale_line_updates,
+        }
 
-        # --- 3. ACTUALIZAR PRECIOS EN LA VENTA (Esta parte no cambia) ---
+    def _prepare_purchase_sync_sale_updates(self, final_costs):
+        """
+        Cambios de coste y precio en la venta a partir de `final_costs`, la lista
+        (producto, coste) de las líneas de compra en su orden. Devuelve
+        {campo: {valor: [ids de líneas de venta]}}.
+        """
+        self.ensure_one()
+        pricing = self.env['sale.pricing.context']
 
-        _logger.info("Iniciando actualización de precios en la Venta desde la Compra.")
-        # Volvemos a leer la PO para tener los datos más recientes
-        purchase_order.invalidate_recordset()
+        # Primera línea de venta de cada producto (un único recorrido).
+        first_sale_lines = {}
+        for line in self.order_line:
+            first_sale_lines.setdefault(line.product_id, line)
 
-        for po_line in purchase_order.order_line:
-            product = po_line.product_id
+        new_sale_values = {}
+        for product, cost in final_costs:
+            sale_line = first_sale_lines.get(product)
+            if not sale_line:
+                continue
             # Usamos el margen de la categoría del producto
-            margin_percent = product.categ_id.margin or 0.0
-            margin_decimal = margin_percent / 100.0
-
-            # Buscamos la línea de venta correspondiente a este producto
-            sale_line = self.order_line.filtered(lambda sol: sol.product_id == product)
-            if sale_line:
-                # Nos aseguramos de actualizar solo una línea si el producto estuviera repetido
-                sale_line = sale_line[0]
-
-                new_price = po_line.price_unit * (1 + margin_decimal)
-
-                # Preparamos los valores a escribir
-                vals_to_write = {'provider_cost': po_line.price_unit}
-                if sale_line.price_unit != new_price:
-                    vals_to_write['price_unit'] = new_price
-
-                sale_line.write(vals_to_write)
-                _logger.info(
-                    f"Precio actualizado para '{product.display_name}'. "
-                    f"Costo: {po_line.price_unit}, Nuevo Precio Venta: {new_price:.2f}"
-                )
+            new_sale_values[sale_line] = (cost, pricing.get_sale_price(product, cost))
 
-        # La notificación de éxito y refresco se mantiene igual
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': _('Proceso Completado'),
-                'message': _('La orden de compra y los precios han sido actualizados.'),
-                'type': 'success',
-                'sticky': False,
-                'next': {
-                    'type': 'ir.actions.act_window_close'
-                }
-            }
-        }
\ No newline at end of file
+        sale_line_updates = {'provider_cost': defaultdict(list), 'price_unit': defaultdict(list)}
+        for sale_line, (cost, new_price) in new_sale_values.items():
+            if sale_line.provider_cost != cost:
+                sale_line_updates['provider_cost'][cost].append(sale_line.id)
+            if sale_line.price_unit != new_price:
+                sale_line_updates['price_unit'][new_price].append(sale_line.id)
+        return {field: dict(values) for field, values in sale_line_updates.items()}
+
+    def _apply_purchase_sync_plan(self, plan):
+        """
+        Aplica un plan de _prepare_purchase_sync_plan con escrituras agrupadas:
+        un unlink, una escritura por cantidad distinta, un create y una escritura
+        por campo y valor distinto en las líneas de venta.
+        """
+        self.ensure_one()
+        PurchaseLine = self.env['purchase.order.line']
+        SaleLine = self.env['sale.order.line']
+
+        purchase_order = self.env['purchase.order'].browse(plan['purchase_order_id'])
+        # Si no existe, la crea vacía. Las líneas se añadirán después.
+        if not purchase_order and plan['lines_to_create']:
+            purchase_order = self.env['purchase.order'].create({
+                'partner_id': plan['partner_id'],
+                'origin': self.name,
+                'x_sale_order_id': self.id,
+                'notes': _('Orden de compra generada desde la venta %s', self.name),
+            })
+            _logger.info(f"Creada nueva orden de compra única: {purchase_order.name}")
+
+        if plan['lines_to_unlink']:
+            PurchaseLine.browse(plan['lines_to_unlink']).unlink()
+            _logger.info(f"Se eliminaron {len(plan['lines_to_unlink'])} líneas de la compra {purchase_order.name}")
+
+        for qty, line_ids in plan['quantity_updates'].items():
+            PurchaseLine.browse(line_ids).write({'product_qty': qty})
+            _logger.info(f"Cantidad actualizada a {qty} en {len(line_ids)} líneas de {purchase_order.name}")
+
+        if plan['lines_to_create']:
+            date_planned = fields.Datetime.now()
+            PurchaseLine.create([
+                dict(vals, order_id=purchase_order.id, date_planned=date_planned)
+                for vals in plan['lines_to_create']
+            ])
+            _logger.info(f"Se añadieron {len(plan['lines_to_create'])} nuevas líneas a la compra {purchase_order.name}")
+
+        if plan['unlink_purchase_order']:
+            purchase_order.button_cancel()
+            purchase_order.unlink()
+            _logger.info(f"Se eliminó la orden de compra vacía {purchase_order.name}")
+            return
+
+        # Al escribir product_qty la compra recalcula price_unit (tramos de precio
+        # del proveedor): el coste de la venta se toma de los precios ya escritos.
+        sale_line_updates = self._prepare_purchase_sync_sale_updates([
+            (po_line.product_id, po_line.price_unit) for po_line in purchase_order.order_line
+        ])
+        for field_name, values in sale_line_updates.items():
+            for value, line_ids in values.items():
+                SaleLine.browse(line_ids).write({field_name: value})
+        _logger.info(
+            f"Precios actualizados en la venta {self.name}: "
+            f"{sum(len(ids) for ids in sale_line_updates['price_unit'].values())} líneas."
+        )
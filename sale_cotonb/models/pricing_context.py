@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api, _
+from odoo.exceptions import UserError
+
+# Proveedor al que se asignan las compras generadas desde las ventas.
+DEFAULT_SUPPLIER_NAME = 'Proveedor Reserva'
+
+# Clave de la caché de precios en cr.cache.
+PRICING_CACHE_KEY = 'sale_pricing_context'
+
+
+class SalePricingContext(models.AbstractModel):
+    """
+    Servicio único con los datos que necesitan los repreciados por compras:
+    proveedor por defecto, márgenes de categoría y costes de producto.
+
+    Los datos se guardan en la caché del cursor (``cr.cache``), de modo que
+    duran lo que dura la transacción y no afectan a otros workers. Los costes
+    se cargan solo para los productos pedidos. Los write/create/unlink de este
+    fichero y de product_category.py invalidan únicamente la parte afectada.
+    """
+    _name = 'sale.pricing.context'
+    _description = 'Contexto de Precios de Compras y Ventas'
+
+    @api.model
+    def get_default_supplier(self):
+        """ Devuelve el proveedor por defecto o lanza un error si no existe. """
+        supplier = self.env['res.partner'].browse(self._get_default_supplier_id())
+        if not supplier:
+            raise UserError(
+                _("No se pudo encontrar el proveedor por defecto '%s'. Por favor, créelo o verifique el nombre.",
+                  DEFAULT_SUPPLIER_NAME))
+        return supplier
+
+    @api.model
+    def get_margin(self, product):
+        """ Margen (%) de la categoría del producto. """
+        return self._get_category_margins().get(product.categ_id.id, 0.0)
+
+    @api.model
+    def get_product_cost(self, product):
+        """ Coste estándar del producto en la compañía actual. """
+        return self._get_product_costs(product)[product.id]
+
+    @api.model
+    def get_sale_price(self, product, cost):
+        """ Precio de venta: coste más el margen de la categoría del producto. """
+        return cost * (1 + self.get_margin(product) / 100.0)
+
+    def _get_pricing_cache(self):
+        """ Caché de la transacción; se descarta en el commit o el rollback. """
+        cr = self.env.cr
+        cache = cr.cache.get(PRICING_CACHE_KEY)
+        if cache is None:
+            cache = cr.cache[PRICING_CACHE_KEY] = {'costs': {}}
+            cr.postcommit.add(lambda: cr.cache.pop(PRICING_CACHE_KEY, None))
+            cr.postrollback.add(lambda: cr.cache.pop(PRICING_CACHE_KEY, None))
+        return cache
+
+    @api.model
+    def _invalidate_pricing_context(self, scope, product_ids=None):
+        """ Invalida una parte de la caché: 'supplier', 'margins' o 'costs'.
+
+        Para 'costs' solo se descartan los productos indicados.
+        """
+        cache = self.env.cr.cache.get(PRICING_CACHE_KEY)
+        if not cache:
+            return
+        if scope != 'costs':
+            cache.pop(scope, None)
+            return
+        for costs in cache['costs'].values():
+            for product_id in product_ids or ():
+                costs.pop(product_id, None)
+
+    def _get_default_supplier_id(self):
+        cache = self._get_pricing_cache()
+        if 'supplier' not in cache:
+            cache['supplier'] = self.env['res.partner'].sudo().search(
+                [('name', '=', DEFAULT_SUPPLIER_NAME)], limit=1).id
+        return cache['supplier']
+
+    def _get_category_margins(self):
+        cache = self._get_pricing_cache()
+        if 'margins' not in cache:
+            categories = self.env['product.category'].sudo().search_read([], ['margin'])
+            cache['margins'] = {category['id']: category['margin'] or 0.0 for category in categories}
+        return cache['margins']
+
+    def _get_product_costs(self, products):
+        """ Costes de los productos pedidos en la compañía actual.
+
+        Solo se leen (en una consulta) los que aún no están en la caché.
+        """
+        company = self.env.company
+        costs = self._get_pricing_cache()['costs'].setdefault(company.id, {})
+        missing = products.filtered(lambda product: product.id not in costs)
+        if missing:
+            missing = missing.sudo().with_company(company)
+            missing.fetch(['standard_price'])
+            costs.update((product.id, product.standard_price) for product in missing)
+        return costs
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partners = super().create(vals_list)
+        if any(vals.get('name') == DEFAULT_SUPPLIER_NAME for vals in vals_list):
+            self.env['sale.pricing.context']._invalidate_pricing_context('supplier')
+        return partners
+
+    def write(self, vals):
+        res = super().write(vals)
+        # El proveedor por defecto puede dejar de llamarse así o archivarse.
+        if 'name' in vals or 'active' in vals:
+            self.env['sale.pricing.context']._invalidate_pricing_context('supplier')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['sale.pricing.context']._invalidate_pricing_context('supplier')
+        return res
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'standard_price' in vals:
+            self.env['sale.pricing.context']._invalidate_pricing_context(
+                'costs', self.product_variant_ids.ids)
+        return res
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'standard_price' in vals:
+            self.env['sale.pricing.context']._invalidate_pricing_context('costs', self.ids)
+        return res
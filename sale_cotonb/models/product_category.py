@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields
+from collections import defaultdict
+
+from odoo import models, fields, api, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
 
 class ProductCategory(models.Model):
     _inherit = 'product.category'
@@ -8,4 +14,107 @@ class ProductCategory(models.Model):
         string="Margen (%)",
         help="Define el margen de beneficio para esta categoría. "
              "Por ejemplo, para un 25%, introduce 25."
-    )
\ No newline at end of file
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        categories = super().create(vals_list)
+        self.env['sale.pricing.context']._invalidate_pricing_context('margins')
+        return categories
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'margin' in vals:
+            self.env['sale.pricing.context']._invalidate_pricing_context('margins')
+            # Al cambiar el margen se reprecian los presupuestos abiertos afectados.
+            if not self.env.context.get('skip_margin_repricing'):
+                self._reprice_open_quotations()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['sale.pricing.context']._invalidate_pricing_context('margins')
+        return res
+
+    def _get_margin_repricing_lines(self):
+        """
+        Líneas de presupuestos abiertos (borrador o enviados) con un producto de
+        estas categorías o de sus categorías hijas y con coste de proveedor.
+        """
+        return self.env['sale.order.line'].search([
+            ('order_id.state', 'in', ('draft', 'sent')),
+            ('product_id.categ_id', 'child_of', self.ids),
+            ('display_type', '=', False),
+            ('provider_cost', '>', 0),
+        ])
+
+    def _prepare_margin_repricing(self):
+        """
+        Calcula los nuevos precios de venta (coste de proveedor + margen de la
+        categoría del producto) y devuelve {nuevo_precio: [ids de líneas]},
+        solo con las líneas cuyo precio cambia.
+        """
+        pricing = self.env['sale.pricing.context']
+        lines_by_price = defaultdict(list)
+        for line in self._get_margin_repricing_lines():
+            new_price = pricing.get_sale_price(line.product_id, line.provider_cost)
+            if line.price_unit != new_price:
+                lines_by_price[new_price].append(line.id)
+        return lines_by_price
+
+    def _reprice_open_quotations(self):
+        """
+        Aplica el repreciado con una escritura por precio distinto. Los campos
+        almacenados dependientes (subtotales, margen de la línea y margen total
+        del pedido) se recalculan en bloque una sola vez por pedido al vaciar
+        la caché del ORM, en lugar de tras cada línea.
+        """
+        lines_by_price = self._prepare_margin_repricing()
+        if not lines_by_price:
+            return 0
+
+        SaleLine = self.env['sale.order.line']
+        all_lines = SaleLine
+        for price, line_ids in lines_by_price.items():
+            lines = SaleLine.browse(line_ids)
+            lines.write({'price_unit': price})
+            all_lines |= lines
+        self.env.flush_all()
+
+        _logger.info(
+            "Repreciado por margen de categoría (%s): %s líneas en %s presupuestos.",
+            ', '.join(self.mapped('display_name')), len(all_lines), len(all_lines.order_id),
+        )
+        return len(all_lines)
+
+    def action_preview_margin_repricing(self):
+        """ Muestra cuántas líneas y presupuestos cambiarían de precio. """
+        line_ids = [line_id for ids in self._prepare_margin_repricing().values() for line_id in ids]
+        lines = self.env['sale.order.line'].browse(line_ids)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Vista previa del repreciado'),
+                'message': _(
+                    '%(lines)s líneas en %(orders)s presupuestos abiertos cambiarían de precio.',
+                    lines=len(lines), orders=len(lines.order_id),
+                ),
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    def action_reprice_open_quotations(self):
+        """ Reaplica el margen actual a los presupuestos abiertos. """
+        count = self._reprice_open_quotations()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Repreciado completado'),
+                'message': _('Se actualizó el precio de %s líneas.', count),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
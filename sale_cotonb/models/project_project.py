@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields
+from odoo import models, fields, api, _
 
 class ProjectProject(models.Model):
     # Heredamos del modelo de proyecto para añadir nuestro campo
@@ -16,8 +16,74 @@ class ProjectProject(models.Model):
         index=True
     )
 
+    # Proyectos creados al confirmar ventas que aún esperan su nombre definitivo.
+    # Forman la cola que se recorre con action_open_next_pending_naming.
+    x_pending_naming = fields.Boolean(
+        string='Pendiente de Nombre',
+        copy=False,
+        index=True
+    )
+
     # Añadimos una restricción a nivel de base de datos para asegurar que no haya dos
     # proyectos con el mismo código. Es una capa extra de seguridad.
     _sql_constraints = [
         ('project_code_unique', 'unique(project_code)', '¡El código del proyecto debe ser único!')
-    ]
\ No newline at end of file
+    ]
+
+    # Los proyectos se cuentan por nombre en el botón inteligente de la venta;
+    # cualquier alta, cambio de nombre o baja invalida ese contador.
+    @api.model_create_multi
+    def create(self, vals_list):
+        projects = super().create(vals_list)
+        self.env['sale.order']._invalidate_counter_cache('project_count')
+        return projects
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals:
+            self.env['sale.order']._invalidate_counter_cache('project_count')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['sale.order']._invalidate_counter_cache('project_count')
+        return res
+
+    @api.model
+    def action_open_next_pending_naming(self):
+        """
+        Abre el asistente de nombre para el siguiente proyecto de la cola.
+        Con 'rename_project_queue_ids' en el contexto la cola se limita a esos
+        proyectos (los de un pedido); si no, se recorren todos los pendientes.
+        """
+        domain = [('x_pending_naming', '=', True)]
+        queue_ids = self.env.context.get('rename_project_queue_ids')
+        if queue_ids:
+            domain.append(('id', 'in', queue_ids))
+        project = self.search(domain, order='id', limit=1)
+        if not project:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Proyectos'),
+                    'message': _('No quedan proyectos pendientes de nombre.'),
+                    'type': 'success',
+                    'next': {'type': 'ir.actions.act_window_close'},
+                },
+            }
+
+        return {
+            'name': _('Asignar Nombre al Proyecto'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'rename.project.wizard',
+            'view_mode': 'form',
+            'target': 'new',  # Para que se abra como una ventana emergente
+            'context': {
+                # Le pasamos los datos al asistente
+                'default_project_id': project.id,
+                'default_name': project.name,
+                'rename_project_queue': True,
+                'rename_project_queue_ids': queue_ids or False,
+            }
+        }
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import models, api, _, fields
 import logging
+from collections import defaultdict
 
 _logger = logging.getLogger(__name__)
 
@@ -27,6 +28,47 @@ class PurchaseOrderLine(models.Model):
 class PurchaseOrder(models.Model):
     _inherit = 'purchase.order'
 
+    # Enlace relacional con la venta que generó la compra. Sustituye a la
+    # comparación de 'origin' con el nombre de la venta (sin índice y que se
+    # rompe cuando la venta cambia de nombre, p. ej. con las versiones -V2).
+    x_sale_order_id = fields.Many2one(
+        'sale.order',
+        string='Venta Origen',
+        compute='_compute_x_sale_order_id',
+        store=True,
+        readonly=False,
+        index=True,
+    )
+
+    @api.depends('order_line.x_source_sale_line_id')
+    def _compute_x_sale_order_id(self):
+        """
+        Toma la venta a partir de las líneas enlazadas ('x_source_sale_line_id').
+        Si ninguna línea está enlazada se conserva el valor asignado al crear la PO.
+        """
+        for po in self:
+            sale_orders = po.order_line.x_source_sale_line_id.order_id
+            if sale_orders:
+                po.x_sale_order_id = sale_orders[:1]
+        # El enlace puede cambiar por recálculo, sin pasar por write
+        self.env['sale.order']._invalidate_counter_cache('purchase_order_count')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = super().create(vals_list)
+        self.env['sale.order']._invalidate_counter_cache('purchase_order_count')
+        return orders
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'x_sale_order_id' in vals or 'order_line' in vals:
+            self.env['sale.order']._invalidate_counter_cache('purchase_order_count')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['sale.order']._invalidate_counter_cache('purchase_order_count')
+        return res
 
     def button_confirm(self):
         res = super(PurchaseOrder, self).button_confirm()
@@ -39,32 +81,23 @@ class PurchaseOrder(models.Model):
         res = self.action_set_to_intermediate()
 
         # 2. Iniciar nuestra lógica personalizada.
-        # 2. Iniciar nuestra lógica personalizada.
+        pricing = self.env['sale.pricing.context']
         for po in self:
-            # Si la compra no tiene un origen, no hacemos nada.
-            if not po.origin:
-                continue
-
-            sale_order = self.env['sale.order'].search([('name', '=', po.origin)], limit=1)
+            # Si la compra no está enlazada a una venta, no hacemos nada.
+            sale_order = po.x_sale_order_id
             if not sale_order:
-                _logger.warning(
-                    f"Actualización de precios omitida: No se encontró el pedido de venta '{po.origin}' "
-                    f"referenciado desde la compra '{po.name}'."
-                )
                 continue
 
             # 3. Tu lógica existente para actualizar precios en la SO.
+            sale_lines_by_product = defaultdict(lambda: self.env['sale.order.line'])
+            for sol in sale_order.order_line:
+                sale_lines_by_product[sol.product_id.id] |= sol
             for line in po.order_line:
                 product = line.product_id
-                margin_percent = product.categ_id.margin or 0.0
-                margin_decimal = margin_percent / 100.0
-                sale_line_to_update = sale_order.order_line.filtered(
-                    lambda sol: sol.product_id == product
-                )
+                sale_line_to_update = sale_lines_by_product.get(product.id)
                 if sale_line_to_update:
-                    new_price = line.price_unit * (1 + margin_decimal)
-                    sale_line_to_update.write({'price_unit': new_price})
-                    sale_line_to_update.write({'provider_cost': line.price_unit})
+                    new_price = pricing.get_sale_price(product, line.price_unit)
+                    sale_line_to_update.write({'price_unit': new_price, 'provider_cost': line.price_unit})
 
                     _logger.info(
                         f"Precio actualizado para '{product.display_name}' en el pedido '{sale_order.name}'. "
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from odoo import models, fields, api, Command, _
+
+_logger = logging.getLogger(__name__)
+
+
+class SalePurchaseResyncJob(models.Model):
+    """
+    Cola de resincronización de compras procesada por un cron, sin broker externo.
+    Cada trabajo guarda las ventas pendientes; el cron las procesa por bloques y
+    confirma la transacción tras cada bloque, de modo que si el worker se
+    reinicia el trabajo continúa desde el último bloque confirmado.
+    """
+    _name = 'sale.purchase.resync.job'
+    _description = 'Resincronización de Compras en Segundo Plano'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='Referencia',
+        required=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: _('Nuevo'),
+    )
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('running', 'En curso'),
+        ('done', 'Terminado'),
+        ('cancel', 'Cancelado'),
+    ], string='Estado', default='pending', required=True, readonly=True, index=True)
+
+    order_ids = fields.Many2many(
+        'sale.order', 'sale_purchase_resync_job_order_rel', 'job_id', 'order_id',
+        string='Ventas', readonly=True,
+    )
+    pending_order_ids = fields.Many2many(
+        'sale.order', 'sale_purchase_resync_job_pending_rel', 'job_id', 'order_id',
+        string='Ventas Pendientes', readonly=True,
+    )
+    failed_order_ids = fields.Many2many(
+        'sale.order', 'sale_purchase_resync_job_failed_rel', 'job_id', 'order_id',
+        string='Ventas con Error', readonly=True,
+    )
+    chunk_size = fields.Integer(
+        string='Tamaño de Bloque',
+        default=50,
+        help="Número de ventas procesadas antes de confirmar la transacción."
+    )
+
+    total_count = fields.Integer(string='Total', compute='_compute_progress')
+    done_count = fields.Integer(string='Procesadas', compute='_compute_progress')
+    progress = fields.Float(string='Progreso (%)', compute='_compute_progress')
+
+    date_start = fields.Datetime(string='Inicio', readonly=True)
+    date_end = fields.Datetime(string='Fin', readonly=True)
+    log = fields.Text(string='Registro', readonly=True)
+
+    @api.depends('order_ids', 'pending_order_ids')
+    def _compute_progress(self):
+        for job in self:
+            job.total_count = len(job.order_ids)
+            job.done_count = job.total_count - len(job.pending_order_ids)
+            job.progress = job.total_count and (job.done_count / job.total_count) * 100 or 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', _('Nuevo')) == _('Nuevo'):
+                vals['name'] = fields.Datetime.to_string(fields.Datetime.now())
+        return super().create(vals_list)
+
+    def action_cancel(self):
+        """ Detiene el trabajo; las ventas ya procesadas no se revierten. """
+        return self.filtered(lambda job: job.state in ('pending', 'running')).write({'state': 'cancel'})
+
+    @api.model
+    def _cron_process_jobs(self, time_budget=300):
+        """
+        Procesa los trabajos pendientes o interrumpidos, en orden de creación,
+        durante como máximo `time_budget` segundos. Si queda trabajo, el cron se
+        vuelve a lanzar inmediatamente.
+        """
+        deadline = time.monotonic() + time_budget
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            if not job._process_chunks(deadline):
+                self.env.ref('sale_cotonb.ir_cron_purchase_resync_jobs')._trigger()
+                return
+
+    def _process_chunks(self, deadline):
+        """
+        Resincroniza las ventas pendientes por bloques de `chunk_size`,
+        confirmando la transacción después de cada bloque.
+        Devuelve False si se agotó el tiempo antes de terminar.
+        """
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+
+        while self.pending_order_ids:
+            # El trabajo puede haberse cancelado desde otra transacción.
+            self.invalidate_recordset(['state'])
+            if self.state == 'cancel':
+                return True
+            if time.monotonic() > deadline:
+                return False
+
+            chunk = self.pending_order_ids[:max(self.chunk_size, 1)]
+            failed = self.env['sale.order']
+            messages = []
+            for order in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        order.action_update_purchase_orders()
+                except Exception as e:
+                    _logger.warning("Resincronización de %s fallida: %s", order.name, e)
+                    failed |= order
+                    messages.append(f"{order.name}: {e}")
+
+            vals = {'pending_order_ids': [Command.unlink(order_id) for order_id in chunk.ids]}
+            if failed:
+                vals['failed_order_ids'] = [Command.link(order_id) for order_id in failed.ids]
+                vals['log'] = '\n'.join(filter(None, [self.log] + messages))
+            self.write(vals)
+            self.env.cr.commit()
+            _logger.info(
+                "Resincronización %s: %s/%s ventas procesadas.",
+                self.name, self.done_count, self.total_count,
+            )
+
+        self.write({'state': 'done', 'date_end': fields.Datetime.now()})
+        self.env.cr.commit()
+        return True
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_line_numbering
+from . import test_cost_totals
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+# Líneas del pedido grande con el que se compara la suma agrupada con el bucle.
+LARGE_ORDER_LINES = 1000
+
+
+@tagged('post_install', '-at_install')
+class TestCostTotals(TransactionCase):
+    """
+    Los totales de coste del pedido se suman en SQL sobre los subtotales
+    guardados de las líneas, sin cargar las líneas en memoria.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Cliente Costes'})
+        cls.product = cls.env['product.product'].create({'name': 'Producto Costes', 'standard_price': 4.0})
+
+    def _create_order(self, line_count):
+        return self.env['sale.order'].create({
+            'partner_id': self.partner.id,
+            'order_line': [
+                Command.create({'product_id': self.product.id, 'product_uom_qty': 2, 'price_unit': 10.0})
+                for _index in range(line_count)
+            ],
+        })
+
+    def test_totals_follow_line_changes(self):
+        order = self._create_order(3)
+        first, second, third = order.order_line
+        self.assertEqual(order.total_coste_estimado, 24.0)
+        self.assertEqual(order.missing_provider_cost_count, 3)
+
+        first.product_uom_qty = 5
+        self.assertEqual(order.total_coste_estimado, 36.0)
+
+        second.unlink()
+        self.assertEqual(order.total_coste_estimado, 28.0)
+        self.assertEqual(order.missing_provider_cost_count, 2)
+        self.assertEqual(order.total_provider_cost, 0.0)
+        self.assertTrue(third.exists())
+
+    def test_totals_do_not_load_lines(self):
+        order = self._create_order(LARGE_ORDER_LINES)
+        self.env.flush_all()
+        lines = order.order_line
+        fields_to_check = [lines._fields[name] for name in ('coste_estimado_subtotal', 'provider_cost_subtotal')]
+
+        # Suma agrupada: una consulta, ninguna línea entra en la caché del ORM
+        self.env.invalidate_all()
+        started = time.perf_counter()
+        order._compute_cost_totals()
+        grouped_elapsed = time.perf_counter() - started
+        self.assertEqual(order.total_coste_estimado, LARGE_ORDER_LINES * 8.0)
+        for field in fields_to_check:
+            self.assertFalse(any(self.env.cache.contains(line, field) for line in lines))
+
+        # Bucle anterior: recorre y carga todas las líneas del pedido
+        self.env.invalidate_all()
+        started = time.perf_counter()
+        sum(line.coste_estimado * line.product_uom_qty for line in order.order_line)
+        sum(line.provider_cost * line.product_uom_qty for line in order.order_line)
+        loop_elapsed = time.perf_counter() - started
+        _logger.info(
+            "Totales de coste de %s líneas: suma agrupada %.4f s, bucle %.4f s",
+            LARGE_ORDER_LINES, grouped_elapsed, loop_elapsed,
+        )
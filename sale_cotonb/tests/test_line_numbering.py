@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.sale_cotonb.models.models import number_order_lines
+
+_logger = logging.getLogger(__name__)
+
+# Tamaños del banco de pruebas y tiempo máximo (segundos) para numerar un pedido.
+BENCHMARK_SIZES = (100, 1000, 5000)
+BENCHMARK_MAX_SECONDS = 1.0
+# Líneas por sección en los pedidos sintéticos.
+SECTION_SIZE = 10
+
+
+def synthetic_lines(count, section_every=SECTION_SIZE):
+    """ Líneas falsas: una sección cada `section_every` líneas y una nota de vez en cuando. """
+    lines = []
+    for index in range(count):
+        if index % section_every == 0:
+            display_type = 'line_section'
+        elif index % 25 == 0:
+            display_type = 'line_note'
+        else:
+            display_type = False
+        lines.append(SimpleNamespace(display_type=display_type))
+    return lines
+
+
+@tagged('post_install', '-at_install')
+class TestLineNumbering(TransactionCase):
+
+    def test_number_order_lines_labels(self):
+        lines = [SimpleNamespace(display_type=display_type) for display_type in (
+            False, 'line_section', False, 'line_note', False, 'line_section', False)]
+        labels = [label for _line, label in number_order_lines(lines)]
+        self.assertEqual(labels, ['', '1', '1.1', '', '1.2', '2', '2.1'])
+        # Desde una sección intermedia solo se numeran esa sección y las siguientes
+        labels = [label for _line, label in number_order_lines(lines, start=5)]
+        self.assertEqual(labels, ['2', '2.1'])
+
+    def test_number_order_lines_benchmark(self):
+        for count in BENCHMARK_SIZES:
+            lines = synthetic_lines(count)
+            started = time.perf_counter()
+            labels = [label for _line, label in number_order_lines(lines)]
+            elapsed = time.perf_counter() - started
+            _logger.info("number_order_lines: %s líneas en %.4f s", count, elapsed)
+            self.assertEqual(len(labels), count)
+            self.assertEqual(labels[-1], '%s.%s' % ((count - 1) // 10 + 1, (count - 1) % 10))
+            self.assertLess(elapsed, BENCHMARK_MAX_SECONDS)
+
+    @contextmanager
+    def _recorded_label_writes(self):
+        """ Recoge los ids de las líneas a las que se escribe la etiqueta de numeración. """
+        SaleOrderLine = type(self.env['sale.order.line'])
+        write = SaleOrderLine.write
+        written = []
+
+        def record(records, vals):
+            if 'line_number_display' in vals:
+                written.extend(records.ids)
+            return write(records, vals)
+
+        with patch.object(SaleOrderLine, 'write', autospec=True, side_effect=record):
+            yield written
+
+    def _get_labels(self, order):
+        order.order_line.invalidate_recordset(['line_number_display'])
+        return {line.id: line.line_number_display or '' for line in order.order_line}
+
+    def _assertOnlyChangedLabelsWritten(self, order, labels_before, written):
+        """ Las etiquetas son las de numerar el pedido completo y solo se han escrito las que cambian. """
+        lines = order.order_line.sorted(lambda line: (line.sequence, line.id))
+        expected = {line.id: label for line, label in number_order_lines(lines)}
+        self.assertEqual(self._get_labels(order), expected)
+        changed = {line_id for line_id, label in expected.items() if labels_before.get(line_id, '') != label}
+        self.assertEqual(sorted(written), sorted(changed))
+        self.assertLessEqual(len(written), SECTION_SIZE)
+
+    def test_renumber_orm_benchmark(self):
+        """ Insertar o mover una línea en la última sección solo reescribe esa sección. """
+        partner = self.env['res.partner'].create({'name': 'Cliente Numeración'})
+        product = self.env['product.product'].create({'name': 'Producto Numeración'})
+        for count in BENCHMARK_SIZES:
+            order = self.env['sale.order'].create({
+                'partner_id': partner.id,
+                'order_line': [
+                    Command.create({'display_type': line.display_type, 'name': 'Línea %s' % index, 'sequence': index * 10})
+                    if line.display_type else
+                    Command.create({'product_id': product.id, 'sequence': index * 10})
+                    for index, line in enumerate(synthetic_lines(count))
+                ],
+            })
+            last_section_sequence = (count - 1) // SECTION_SIZE * SECTION_SIZE * 10
+
+            # Insertar una línea al principio de la última sección
+            labels_before = self._get_labels(order)
+            with self._recorded_label_writes() as written:
+                started = time.perf_counter()
+                order.write({'order_line': [
+                    Command.create({'product_id': product.id, 'sequence': last_section_sequence + 5}),
+                ]})
+                elapsed = time.perf_counter() - started
+            _logger.info("Insertar una línea en un pedido de %s líneas: %.4f s, %s etiquetas escritas",
+                         count, elapsed, len(written))
+            self._assertOnlyChangedLabelsWritten(order, labels_before, written)
+
+            # Mover la última línea al principio de su sección
+            last_line = order.order_line.sorted(lambda line: (line.sequence, line.id))[-1]
+            labels_before = self._get_labels(order)
+            with self._recorded_label_writes() as written:
+                started = time.perf_counter()
+                last_line.sequence = last_section_sequence + 1
+                elapsed = time.perf_counter() - started
+            _logger.info("Mover una línea en un pedido de %s líneas: %.4f s, %s etiquetas escritas",
+                         count, elapsed, len(written))
+            self._assertOnlyChangedLabelsWritten(order, labels_before, written)
+
+    def test_resequence_renumbers_once_per_order(self):
+        product = self.env['product.product'].create({'name': 'Producto Numeración'})
+        order = self.env['sale.order'].create({
+            'partner_id': self.env['res.partner'].create({'name': 'Cliente Numeración'}).id,
+            'order_line': [
+                Command.create({'display_type': 'line_section', 'name': 'Obra', 'sequence': 1}),
+                Command.create({'product_id': product.id, 'sequence': 2}),
+                Command.create({'product_id': product.id, 'sequence': 3}),
+                Command.create({'display_type': 'line_section', 'name': 'Montaje', 'sequence': 4}),
+                Command.create({'product_id': product.id, 'sequence': 5}),
+            ],
+        })
+        section_2, line_2_1 = order.order_line.sorted('sequence')[3:5]
+        SaleOrder = type(self.env['sale.order'])
+        with patch.object(SaleOrder, '_renumber_lines', autospec=True,
+                          side_effect=SaleOrder._renumber_lines) as renumber:
+            # Arrastrar la segunda sección al principio: varias líneas en una escritura
+            order.write({'order_line': [
+                Command.update(section_2.id, {'sequence': 0}),
+                Command.update(line_2_1.id, {'sequence': 0}),
+            ]})
+        self.assertEqual(renumber.call_count, 1)
+        self.assertEqual(
+            order.order_line.sorted(lambda line: (line.sequence, line.id)).mapped('line_number_display'),
+            ['1', '1.1', '2', '2.1', '2.2'],
+        )
@@ -85,7 +85,12 @@ class RenameProjectWizard(models.TransientModel):
             self.project_id.write({
                 'name': final_project_name,
                 'project_code': new_code,
+                'x_pending_naming': False,
             })
 
+        # Si el asistente se abrió desde la cola, seguimos con el siguiente proyecto.
+        if self.env.context.get('rename_project_queue'):
+            return self.env['project.project'].action_open_next_pending_naming()
+
         return {'type': 'ir.actions.act_window_close'}
 